@@ -0,0 +1,86 @@
+"""
+Per-request overhead of the shared API layer (mysite/api.py) against the
+hand-written path it replaced: method check, json.loads, field checks and
+JsonResponse. Views are called directly with RequestFactory requests, so no
+middleware, URL resolution or database is involved.
+
+    python -m benchmarks.bench_api --repeat 20000
+
+The codec row shows whether orjson is installed; without it the API layer
+uses the standard library json module.
+"""
+
+import argparse
+import json
+
+from benchmarks.common import setup_django, timed, print_table
+
+
+def make_views(result):
+    from django.http import JsonResponse
+    from mysite.api import ApiError, Field, api_view
+
+    def legacy(request):
+        if request.method == "POST":
+            try:
+                data = json.loads(request.body)
+                if not (data.get("email") and data.get("verification_token") and data.get("lab_id")):
+                    return JsonResponse({"success": False, "error": "Missing required fields"}, status=400)
+                return JsonResponse(result, safe=False)
+            except json.JSONDecodeError:
+                return JsonResponse({"success": False, "error": "Invalid JSON"}, status=400)
+            except Exception as e:
+                return JsonResponse({"success": False, "error": str(e)}, status=500)
+        return JsonResponse({"success": False, "error": "Invalid request method"}, status=405)
+
+    @api_view("POST", success_flag=True, schema={
+        "email": Field(str, message="Missing required fields"),
+        "verification_token": Field(str, message="Missing required fields"),
+        "lab_id": Field(str, message="Missing required fields"),
+    })
+    def api(request):
+        if request.json["lab_id"] == "missing":
+            raise ApiError("Lab not found", status=404)
+        return result
+
+    return legacy, api
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.test import RequestFactory
+    from mysite import api
+
+    factory = RequestFactory()
+    body = json.dumps({"email": "student@example.com", "verification_token": "a1B2c3D4e5F6", "lab_id": "frankhertz1"})
+    payloads = {
+        "small response": {"success": True},
+        # The shape of a 1000-client verify_labs_from_socket answer
+        "large response": {"success": True, "results": [{"success": i % 3 != 0} for i in range(1000)]},
+    }
+
+    def request():
+        return factory.post("/", body, content_type="application/json")
+
+    def microseconds(stats):
+        return {key.replace("_ms", "_us"): f"{value * 1000:.1f}" for key, value in stats.items()}
+
+    rows = [{"path": "request construction only", **microseconds(timed(request, repeat=args.repeat))}]
+    for payload_name, payload in payloads.items():
+        legacy, api_path = make_views(payload)
+        assert json.loads(legacy(request()).content) == json.loads(api_path(request()).content)
+        for name, view in (("legacy", legacy), ("api_view", api_path)):
+            stats = timed(lambda: view(request()), repeat=args.repeat)
+            rows.append({"path": f"{name}, {payload_name}", **microseconds(stats)})
+
+    print(f"\nPer-request time over {args.repeat} calls, codec: "
+          f"{'orjson' if api.orjson is not None else 'stdlib json'}")
+    print_table(rows, ["path", "mean_us", "p50_us", "p95_us", "max_us"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Mixed read/write lab traffic from concurrent clients against each database
+profile: Django's stock SQLite settings, the tuned SQLite profile from
+mysite/settings.py (WAL, synchronous=NORMAL, mmap, busy timeout, IMMEDIATE
+transactions) and, with --postgres, the Postgres profile configured through
+the DJANGO_DB_* environment variables.
+
+    python -m benchmarks.bench_database --threads 8 --requests 200
+    DJANGO_DB_NAME=bench DJANGO_DB_USER=... python -m benchmarks.bench_database --postgres
+
+Each client is a thread with its own connection, issuing get_active_labs and
+get_all_labs reads and start_lab and accept_collab writes in the --mix ratio.
+Every client is invited to --requests labs beforehand, so each accept_collab
+call accepts a pending invite. Any response other than 2xx counts as an error.
+Every profile runs in a fresh subprocess against a freshly seeded database.
+"""
+
+import argparse
+import json
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+
+from benchmarks.common import database_profile, setup_django, seed, print_table
+
+PROFILES = ("stock", "tuned", "postgres")
+
+
+def client_thread(user, invites, args, results, barrier):
+    from django.db import connection
+    from django.test import Client
+
+    client = Client()
+    client.force_login(user)
+    rng = random.Random(user.pk)
+    counter = 0
+
+    def read():
+        path = rng.choice(("/auth/get_active_labs/", "/auth/get_all_labs/"))
+        return "read", client.get(path)
+
+    def start_lab():
+        nonlocal counter
+        counter += 1
+        return "start_lab", client.post("/auth/start_lab/", {
+            "lab_id": f"bench-{user.pk}-{counter}",
+            "lab_name": "Bench",
+            "collaborators": rng.sample(args.emails, args.collaborators),
+            "time_restraint": 1,
+        }, content_type="application/json")
+
+    def accept_collab():
+        return "accept_collab", client.post(
+            "/auth/accept_collaboration/", {"lab_id": invites.pop()}, content_type="application/json"
+        )
+
+    read_share, start_share, _ = args.mix
+    samples = []
+    barrier.wait()
+    for _ in range(args.requests):
+        roll = rng.random()
+        operation = read if roll < read_share else start_lab if roll < read_share + start_share else accept_collab
+        started = time.perf_counter()
+        kind, response = operation()
+        samples.append((kind, (time.perf_counter() - started) * 1000, response.status_code))
+    results.extend(samples)
+    connection.close()
+
+
+def run_profile(profile, args):
+    """Worker mode: seed, run the clients and print one JSON result line."""
+    setup_django(database_profile(profile))
+    from django.core.management import call_command
+    from django.test.utils import setup_test_environment
+    from custom_auth.models import CustomUser, Collaboration
+
+    setup_test_environment()
+    call_command("migrate", verbosity=0)
+    random.seed(0)
+    args.emails, lab_ids = seed(args.users, args.labs, args.labs * 3)
+
+    users = list(CustomUser.objects.order_by("id")[:args.threads])
+    # Invite each client to labs it has no collaboration in yet, one per request
+    pending = {}
+    for user in users:
+        invited = set(Collaboration.objects.filter(collab_email=user.email).values_list("lab_id", flat=True))
+        pending[user.email] = random.sample([lab_id for lab_id in lab_ids if lab_id not in invited], args.requests)
+    Collaboration.objects.bulk_create(
+        Collaboration(lab_id=lab_id, collab_email=email, permission="write")
+        for email, invites in pending.items() for lab_id in invites
+    )
+
+    results = []
+    barrier = threading.Barrier(args.threads + 1)
+    threads = [
+        threading.Thread(target=client_thread, args=(user, pending[user.email], args, results, barrier))
+        for user in users
+    ]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    summary = {"profile": profile, "requests_per_s": round(len(results) / elapsed, 1)}
+    for kind in ("read", "start_lab", "accept_collab"):
+        latencies = sorted(ms for k, ms, _ in results if k == kind)
+        if latencies:
+            summary[f"{kind} p50"] = round(statistics.median(latencies), 2)
+            summary[f"{kind} p95"] = round(latencies[int(len(latencies) * 0.95) - 1], 2)
+    errors = Counter(status for _, _, status in results if not 200 <= status < 300)
+    summary["errors"] = sum(errors.values())
+    summary["error statuses"] = ", ".join(f"{status} x{count}" for status, count in sorted(errors.items())) or "-"
+    print(json.dumps(summary))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="requests per client")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--labs", type=int, default=500)
+    parser.add_argument("--collaborators", type=int, default=10)
+    parser.add_argument("--mix", type=float, nargs=3, default=[0.7, 0.15, 0.15],
+                        metavar=("READ", "START_LAB", "ACCEPT"))
+    parser.add_argument("--postgres", action="store_true", help="also run the Postgres profile")
+    parser.add_argument("--profile", choices=PROFILES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.profile:
+        run_profile(args.profile, args)
+        return
+
+    profiles = ["stock", "tuned"] + (["postgres"] if args.postgres else [])
+    rows = []
+    for profile in profiles:
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_database", "--profile", profile, *sys.argv[1:]],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        rows.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"\n{args.threads} clients x {args.requests} requests, mix read/start_lab/accept_collab = "
+          f"{'/'.join(str(share) for share in args.mix)} (latencies in ms)")
+    columns = ["profile", "requests_per_s"]
+    for kind in ("read", "start_lab", "accept_collab"):
+        columns += [f"{kind} p50", f"{kind} p95"]
+    print_table(rows, columns + ["errors", "error statuses"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+EXPLAIN plans and latencies of the hot lab/collaboration lookups before and
+after the Collaboration indexes from custom_auth migration 0003. LabsActive
+lookups go through its primary key lab_id and need no index of their own.
+
+    python -m benchmarks.bench_indexes --users 20000 --labs 20000 --collaborations 60000
+"""
+
+import argparse
+import random
+
+from benchmarks.common import setup_django, seed, timed, print_table
+
+INDEX_MIGRATION = "0003_lab_lookup_indexes"
+
+
+def lookups(emails, lab_ids):
+    from custom_auth.models import LabsActive, Collaboration
+
+    lab = LabsActive.objects.get(lab_id=random.choice(lab_ids))
+    owner_email = lab.started_by.email
+    collaboration = Collaboration.objects.order_by("?").first()
+
+    # (name, queryset factory) pairs mirroring the filters in custom_auth/views.py
+    return [
+        ("get_active_labs", lambda: Collaboration.objects.filter(
+            collab_email=random.choice(emails), accepted=True)),
+        ("pending_invites", lambda: Collaboration.objects.filter(
+            collab_email=random.choice(emails), accepted=False)),
+        ("accept_collab", lambda: Collaboration.objects.filter(
+            lab__lab_id=collaboration.lab_id, collab_email=collaboration.collab_email)),
+        ("rejoin_lab_owned", lambda: LabsActive.objects.filter(
+            started_by__email=owner_email, lab_id=lab.lab_id)),
+        ("verify_owned", lambda: LabsActive.objects.filter(
+            started_by__email=owner_email, lab_id=lab.lab_id, verification_token=lab.verification_token)),
+        ("verify_shared", lambda: Collaboration.objects.filter(
+            collab_email=collaboration.collab_email, lab__lab_id=collaboration.lab_id,
+            lab__verification_token=lab.verification_token, accepted=True)),
+    ]
+
+
+def measure(label, queries, repeat):
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+
+    rows = []
+    print(f"\n== {label} ==")
+    for name, queryset in queries:
+        print(f"\n{name}:\n{queryset().explain()}")
+        rows.append({"query": name, **{
+            key: f"{value:.3f}" for key, value in timed(lambda: list(queryset()), repeat=repeat).items()
+        }})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--labs", type=int, default=20000)
+    parser.add_argument("--collaborations", type=int, default=60000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.management import call_command
+
+    # Build the schema as it was before the indexes, then seed it
+    call_command("migrate", verbosity=0)
+    call_command("migrate", "custom_auth", "0002", verbosity=0)
+    random.seed(0)
+    emails, lab_ids = seed(args.users, args.labs, args.collaborations)
+    queries = lookups(emails, lab_ids)
+
+    before = measure("without composite indexes", queries, args.repeat)
+    call_command("migrate", "custom_auth", INDEX_MIGRATION, verbosity=0)
+    after = measure("with composite indexes", queries, args.repeat)
+
+    print(f"\nLatency over {args.repeat} runs, {args.users} users / {args.labs} labs / "
+          f"{args.collaborations} collaborations")
+    rows = []
+    for old, new in zip(before, after):
+        rows.append({
+            "query": old["query"],
+            "p50 before": old["p50_ms"], "p50 after": new["p50_ms"],
+            "p95 before": old["p95_ms"], "p95 after": new["p95_ms"],
+        })
+    print_table(rows, ["query", "p50 before", "p50 after", "p95 before", "p95 after"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Bytes and latency of polling the lab listing endpoints, through the full
+middleware stack, in three modes:
+
+    plain        every poll is a full 200, no Accept-Encoding
+    compressed   Accept-Encoding: gzip, br
+    conditional  compressed, and If-None-Match with the ETag of a response
+                 fetched a second before the timed polls
+
+    python -m benchmarks.bench_polling --shared-labs 50 --directory 100
+
+The polling user has --shared-labs accepted collaborations and pages through
+a --directory sized page of get_all_emails. get_all_labs is validated by its
+body, whose time_remaining changes every second while a station is in use;
+with --stations-in-use above 0 its conditional polls are therefore full
+responses, as they are for a client polling once a second or less often.
+"""
+
+import argparse
+import time
+
+from benchmarks.common import database_profile, setup_django, seed, timed, print_table
+
+MODES = {
+    "plain": {},
+    "compressed": {"Accept-Encoding": "gzip, br"},
+}
+
+
+def generate(args):
+    from datetime import timedelta
+    from custom_auth.models import CustomUser, LabStation, LabsActive, Collaboration
+
+    seed(args.users, args.labs, 0)
+    user = CustomUser.objects.create_user(email="poller@example.com")
+    owners = list(CustomUser.objects.exclude(pk=user.pk)[:args.shared_labs])
+    labs = LabsActive.objects.bulk_create(
+        LabsActive(
+            lab_id=f"shared{i}", lab_name=f"Shared lab {i}", started_by=owner,
+            max_time=timedelta(hours=2), allow_collab=True, verification_token=f"token{i}",
+        )
+        for i, owner in enumerate(owners)
+    )
+    Collaboration.objects.bulk_create(
+        Collaboration(lab=lab, collab_email=user.email, permission="write", accepted=True) for lab in labs
+    )
+    LabStation.objects.bulk_create(
+        LabStation(lab_id=f"lab{i}", name=f"Station {i}", position=i) for i in range(args.stations)
+    )
+    # seed() started labs lab0..lab{labs-1}; keep only the first few in use
+    LabsActive.objects.filter(lab_id__startswith="lab").exclude(
+        lab_id__in=[f"lab{i}" for i in range(args.stations_in_use)]
+    ).delete()
+    return user
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--labs", type=int, default=100)
+    parser.add_argument("--shared-labs", type=int, default=50)
+    parser.add_argument("--stations", type=int, default=30)
+    parser.add_argument("--stations-in-use", type=int, default=5)
+    parser.add_argument("--directory", type=int, default=100, help="get_all_emails page size")
+    parser.add_argument("--repeat", type=int, default=500)
+    args = parser.parse_args()
+
+    setup_django(database_profile("tuned"))
+    from django.core.management import call_command
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext, setup_test_environment
+
+    setup_test_environment()
+    call_command("migrate", verbosity=0)
+    client = Client()
+    client.force_login(generate(args))
+
+    endpoints = {
+        "get_active_labs": "/auth/get_active_labs/",
+        "get_all_labs": "/auth/get_all_labs/",
+        "get_all_emails": f"/auth/get_all_emails/?limit={args.directory}",
+    }
+    rows = []
+    for name, path in endpoints.items():
+        client.get(path)  # Warm the session, user and catalog caches
+        modes = dict(MODES)
+        etag = client.get(path, headers=MODES["compressed"])["ETag"]
+        time.sleep(1.1)
+        modes["conditional"] = {**MODES["compressed"], "If-None-Match": etag}
+
+        for mode, headers in modes.items():
+            responses = []
+            stats = timed(lambda: responses.append(client.get(path, headers=headers)), repeat=args.repeat)
+            with CaptureQueriesContext(connection) as queries:
+                client.get(path, headers=headers)
+            last = responses[-1]
+            rows.append({
+                "endpoint": name,
+                "mode": mode,
+                "status": last.status_code,
+                "encoding": last.get("Content-Encoding", "-"),
+                "body_bytes": len(last.content),
+                "not_modified": f"{sum(r.status_code == 304 for r in responses) / len(responses):.0%}",
+                "queries": len(queries),
+                **{key: f"{value:.3f}" for key, value in stats.items()},
+            })
+
+    print(f"\n{args.repeat} polls per endpoint and mode; latencies in ms")
+    print_table(rows, ["endpoint", "mode", "status", "encoding", "body_bytes", "not_modified", "queries",
+                       "mean_ms", "p50_ms", "p95_ms"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Lab start latency and query count for growing collaborator lists: the old
+one-INSERT-per-collaborator loop against the start_lab view, which writes the
+lab and a single bulk INSERT in one transaction.
+
+    python -m benchmarks.bench_start_lab --sizes 1 10 30 100 --repeat 50
+"""
+
+import argparse
+import itertools
+from datetime import timedelta
+
+from benchmarks.common import setup_django, timed, print_table
+
+
+def legacy_start_lab(owner, lab_id, emails):
+    # The pre-transaction code path: no atomic block, one INSERT per email
+    from custom_auth.models import LabsActive, Collaboration
+
+    lab = LabsActive.objects.create(
+        lab_id=lab_id, lab_name=lab_id, started_by=owner, allow_collab=True, max_time=timedelta(hours=1)
+    )
+    for email in emails:
+        Collaboration.objects.create(lab=lab, collab_email=email, permission="write", accepted=False)
+
+
+def count_queries(func):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    with CaptureQueriesContext(connection) as queries:
+        func()
+    return len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 30, 100])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.management import call_command
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+    from custom_auth.models import CustomUser, LabsActive
+
+    setup_test_environment()
+    call_command("migrate", verbosity=0)
+    owner = CustomUser.objects.create_user(email="owner@example.com")
+    client = Client()
+    client.force_login(owner)
+    lab_ids = (f"lab{i}" for i in itertools.count())
+
+    def legacy(emails):
+        legacy_start_lab(owner, next(lab_ids), emails)
+
+    def view(emails):
+        response = client.post("/auth/start_lab/", {
+            "lab_id": next(lab_ids), "lab_name": "Bench", "collaborators": emails, "time_restraint": 1,
+        }, content_type="application/json")
+        assert response.status_code == 200, response.content
+
+    rows = []
+    for size in args.sizes:
+        emails = [f"student{i}@example.com" for i in range(size)]
+        for name, start in (("legacy loop", legacy), ("start_lab", view)):
+            stats = timed(lambda: start(emails), repeat=args.repeat)
+            rows.append({
+                "collaborators": size,
+                "path": name,
+                "queries": count_queries(lambda: start(emails)),
+                **{key: f"{value:.3f}" for key, value in stats.items()},
+            })
+            # Keep the tables small so later sizes are not measured against a bigger index
+            LabsActive.objects.all().delete()
+
+    print(f"\nLab start latency over {args.repeat} runs (SQLite)")
+    print_table(rows, ["collaborators", "path", "queries", "mean_ms", "p50_ms", "p95_ms", "max_ms"])
+
+
+if __name__ == "__main__":
+    main()
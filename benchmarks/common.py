@@ -0,0 +1,137 @@
+"""
+Shared helpers for the scripts in this directory.
+
+Every benchmark runs against its own throwaway SQLite database, never the
+development db.sqlite3, and is started from the project root, e.g.
+
+    python -m benchmarks.bench_indexes
+"""
+
+import os
+import random
+import statistics
+import string
+import tempfile
+import time
+from datetime import timedelta
+
+
+def setup_django(database=None):
+    """
+    Configure Django against a temporary SQLite file (or ``database``, a
+    DATABASES["default"] dict) and return the settings module.
+    """
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mysite.settings")
+
+    import django
+    from django.conf import settings
+
+    if database is None:
+        database = {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.sqlite3"),
+        }
+    settings.DATABASES["default"] = database
+    # The test client sends requests to "testserver"
+    settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, "testserver"]
+    django.setup()
+    return settings
+
+
+def database_profile(profile):
+    """
+    DATABASES["default"] for a fresh database with one of the profiles from
+    mysite/settings.py: "stock" (Django's SQLite defaults), "tuned" (the
+    project's SQLite options) or "postgres" (configured by DJANGO_DB_*).
+    """
+    if profile == "postgres":
+        os.environ["DJANGO_DB_ENGINE"] = "postgres"
+    from mysite import settings as project_settings
+
+    if profile == "postgres":
+        return dict(project_settings.DATABASES["default"])
+    config = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.sqlite3"),
+    }
+    if profile == "tuned":
+        config["OPTIONS"] = dict(project_settings.DATABASES["default"]["OPTIONS"])
+    return config
+
+
+def timed(func, repeat=200, warmup=5):
+    """Call ``func`` repeatedly and return latency percentiles in milliseconds."""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        "mean_ms": statistics.fmean(samples),
+        "p50_ms": samples[len(samples) // 2],
+        "p95_ms": samples[int(len(samples) * 0.95) - 1],
+        "max_ms": samples[-1],
+    }
+
+
+def random_token(length=12):
+    return "".join(random.choices(string.ascii_letters + string.digits, k=length))
+
+
+def seed(users, labs, collaborations, batch_size=5000, password=None):
+    """
+    Bulk-create ``users`` users, ``labs`` active labs owned by random users and
+    ``collaborations`` invitations (about half accepted) between them. Users
+    can log in with ``password`` if one is given; it is hashed once and shared.
+    Returns the created emails and lab ids.
+    """
+    from django.contrib.auth.hashers import make_password
+    from custom_auth.models import CustomUser, LabsActive, Collaboration
+
+    password_hash = make_password(password) if password else "!"
+    emails = [f"user{i}@example.com" for i in range(users)]
+    CustomUser.objects.bulk_create(
+        (CustomUser(email=email, password=password_hash) for email in emails), batch_size=batch_size
+    )
+    user_ids = list(CustomUser.objects.values_list("id", flat=True))
+
+    lab_ids = [f"lab{i}" for i in range(labs)]
+    # bulk_create bypasses LabsActive.save, so tokens are generated here
+    LabsActive.objects.bulk_create(
+        (
+            LabsActive(
+                lab_id=lab_id,
+                lab_name=f"Lab {lab_id}",
+                started_by_id=random.choice(user_ids),
+                max_time=timedelta(hours=2),
+                allow_collab=True,
+                verification_token=random_token(),
+            )
+            for lab_id in lab_ids
+        ),
+        batch_size=batch_size,
+    )
+
+    Collaboration.objects.bulk_create(
+        (
+            Collaboration(
+                lab_id=random.choice(lab_ids),
+                collab_email=random.choice(emails),
+                permission="write",
+                accepted=random.random() < 0.5,
+            )
+            for _ in range(collaborations)
+        ),
+        batch_size=batch_size,
+    )
+    return emails, lab_ids
+
+
+def print_table(rows, columns):
+    widths = [max(len(str(column)), *(len(str(row.get(column, ""))) for row in rows)) for column in columns]
+    print("  ".join(str(column).ljust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(str(row.get(column, "")).ljust(width) for column, width in zip(columns, widths)))
@@ -0,0 +1,284 @@
+"""
+Load test of a lab-session traffic mix, entirely in-process (no network).
+
+A fresh database is seeded with --users users, --labs running labs and
+--collaborations invitations. --concurrency virtual users (one thread and
+test client each, owners of seeded labs) then replay a weighted mix of
+login, get_all_labs, start_lab, rejoin_lab, verify_lab_from_socket and
+predict_intentions calls for --duration seconds or --requests requests.
+Requests go through the full middleware stack and URL routing.
+
+    python -m benchmarks.loadtest --concurrency 16 --duration 30 --output run.json
+    python -m benchmarks.loadtest --weights get_all_labs=10,verify_lab_from_socket=10 --compare run.json
+
+Per endpoint it reports requests, errors (5xx), throughput and p50/p95/p99
+latency, and --output saves the run as JSON; --compare prints the p95 and
+throughput change against a saved run. predict_intentions is left out of
+the mix when the fastText model files are not present.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import random
+import threading
+import time
+
+from benchmarks.common import database_profile, setup_django, seed, print_table
+
+PASSWORD = "load-test-password"
+
+DEFAULT_WEIGHTS = {
+    "login": 1,
+    "get_all_labs": 30,
+    "start_lab": 5,
+    "rejoin_lab": 15,
+    "verify_lab_from_socket": 34,
+    "predict_intentions": 15,
+}
+
+MESSAGES = [
+    "where is the circular thermometer?",
+    "how do I turn on the power supply",
+    "what does the oscilloscope show",
+    "the voltage reading is zero",
+    "how long should I wait for the filament to heat up",
+]
+
+
+def parse_weights(text):
+    weights = dict(DEFAULT_WEIGHTS)
+    for item in filter(None, (text or "").split(",")):
+        name, _, weight = item.partition("=")
+        if name not in weights:
+            raise SystemExit(f"Unknown endpoint {name!r}; choose from {', '.join(weights)}")
+        weights[name] = float(weight)
+    return {name: weight for name, weight in weights.items() if weight > 0}
+
+
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+class VirtualUser:
+    """One logged-in lab user issuing requests from its own thread."""
+
+    def __init__(self, user, owned_labs, emails, rng):
+        from django.test import Client
+
+        self.user = user
+        self.owned_labs = owned_labs  # [(lab_id, verification_token)]
+        self.emails = emails
+        self.rng = rng
+        self.started = 0
+        self.client = Client()
+        self.client.force_login(user)
+
+    def post(self, path, body):
+        return self.client.post(path, body, content_type="application/json")
+
+    def login(self):
+        return self.post("/auth/login_user/", {"email": self.user.email, "password": PASSWORD})
+
+    def get_all_labs(self):
+        return self.client.get("/auth/get_all_labs/")
+
+    def start_lab(self):
+        self.started += 1
+        lab_id = f"load-{self.user.pk}-{self.started}"
+        response = self.post("/auth/start_lab/", {
+            "lab_id": lab_id,
+            "lab_name": "Load test",
+            "collaborators": self.rng.sample(self.emails, 5),
+            "time_restraint": 1,
+        })
+        if response.status_code == 200:
+            self.owned_labs.append((lab_id, response.json()["verification_token"]))
+        return response
+
+    def rejoin_lab(self):
+        lab_id, _ = self.rng.choice(self.owned_labs)
+        return self.post("/auth/rejoin_lab/", {"lab_id": lab_id})
+
+    def verify_lab_from_socket(self):
+        lab_id, token = self.rng.choice(self.owned_labs)
+        return self.post("/auth/verify_lab_from_socket/", {
+            "email": self.user.email, "lab_id": lab_id, "verification_token": token,
+        })
+
+    def predict_intentions(self):
+        return self.post("/chat/predict_intentions/", {"message": self.rng.choice(MESSAGES)})
+
+
+def generate(args):
+    """Seed the database; return (user, owned labs) pairs for the virtual users."""
+    from custom_auth.models import CustomUser, LabsActive
+
+    random.seed(args.seed)
+    emails, _ = seed(args.users, args.labs, args.collaborations, password=PASSWORD)
+
+    owned = {}
+    for lab_id, token, owner_id in LabsActive.objects.values_list("lab_id", "verification_token", "started_by_id"):
+        owned.setdefault(owner_id, []).append((lab_id, token))
+    owners = sorted(owned)[:args.concurrency]
+    if len(owners) < args.concurrency:
+        raise SystemExit(f"Only {len(owners)} users own labs; raise --labs or lower --concurrency")
+    users = CustomUser.objects.in_bulk(owners)
+    return emails, [(users[owner_id], owned[owner_id]) for owner_id in owners]
+
+
+def drive(virtual_users, weights, args):
+    names = list(weights)
+    cumulative = list(weights.values())
+    samples = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    lock = threading.Lock()
+    barrier = threading.Barrier(len(virtual_users) + 1)
+    remaining = [args.requests]
+
+    def take_request():
+        # Shared budget for --requests; --duration alone never runs out
+        if args.requests is None:
+            return True
+        with lock:
+            remaining[0] -= 1
+            return remaining[0] >= 0
+
+    def run(virtual_user):
+        from django.db import connection
+
+        local_samples = {name: [] for name in names}
+        local_errors = {name: 0 for name in names}
+        barrier.wait()
+        while time.perf_counter() < deadline and take_request():
+            name = virtual_user.rng.choices(names, cum_weights=cumulative)[0]
+            started = time.perf_counter()
+            response = getattr(virtual_user, name)()
+            local_samples[name].append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 500:
+                local_errors[name] += 1
+            if args.think_ms:
+                time.sleep(virtual_user.rng.expovariate(1000 / args.think_ms))
+        with lock:
+            for name in names:
+                samples[name].extend(local_samples[name])
+                errors[name] += local_errors[name]
+        connection.close()
+
+    for i in range(1, len(cumulative)):
+        cumulative[i] += cumulative[i - 1]
+    deadline = float("inf")
+    threads = [threading.Thread(target=run, args=(virtual_user,)) for virtual_user in virtual_users]
+    for thread in threads:
+        thread.start()
+    deadline = time.perf_counter() + args.duration
+    started = time.perf_counter()
+    barrier.wait()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    endpoints = {}
+    for name in names:
+        latencies = sorted(samples[name])
+        if not latencies:
+            continue
+        endpoints[name] = {
+            "requests": len(latencies),
+            "errors": errors[name],
+            "throughput_rps": len(latencies) / elapsed,
+            "p50_ms": percentile(latencies, 0.50),
+            "p95_ms": percentile(latencies, 0.95),
+            "p99_ms": percentile(latencies, 0.99),
+        }
+    total = sum(endpoint["requests"] for endpoint in endpoints.values())
+    return elapsed, endpoints, {
+        "requests": total,
+        "errors": sum(endpoint["errors"] for endpoint in endpoints.values()),
+        "throughput_rps": total / elapsed,
+    }
+
+
+def print_report(result, baseline=None):
+    rows = []
+    for name, endpoint in result["endpoints"].items():
+        row = {"endpoint": name, **{
+            key: f"{value:.2f}" if isinstance(value, float) else value for key, value in endpoint.items()
+        }}
+        previous = (baseline or {}).get("endpoints", {}).get(name)
+        if previous:
+            row["p95 change"] = f"{(endpoint['p95_ms'] / previous['p95_ms'] - 1) * 100:+.0f}%"
+            row["rps change"] = f"{(endpoint['throughput_rps'] / previous['throughput_rps'] - 1) * 100:+.0f}%"
+        rows.append(row)
+    total = result["total"]
+    rows.append({"endpoint": "total", "requests": total["requests"], "errors": total["errors"],
+                 "throughput_rps": f"{total['throughput_rps']:.2f}"})
+
+    config = result["config"]
+    print(f"\n{config['concurrency']} virtual users for {result['elapsed_seconds']:.1f}s on the "
+          f"{config['database']} database; latencies in ms")
+    columns = ["endpoint", "requests", "errors", "throughput_rps", "p50_ms", "p95_ms", "p99_ms"]
+    if baseline:
+        columns += ["p95 change", "rps change"]
+    print_table(rows, columns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--labs", type=int, default=500)
+    parser.add_argument("--collaborations", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=16, help="virtual users, one thread each")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to run")
+    parser.add_argument("--requests", type=int, default=None, help="stop after this many requests in total")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="mean pause between a user's requests")
+    parser.add_argument("--weights", help="e.g. get_all_labs=10,login=0 to change or drop endpoints")
+    parser.add_argument("--database", choices=["stock", "tuned", "postgres"], default="tuned")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for data and request mix")
+    parser.add_argument("--output", help="save the results to this JSON file")
+    parser.add_argument("--compare", help="JSON file of an earlier run to compare against")
+    args = parser.parse_args()
+
+    weights = parse_weights(args.weights)
+    setup_django(database_profile(args.database))
+    from django.core.management import call_command
+    from django.test.utils import setup_test_environment
+    from chat_assistant.registry import registry
+
+    if "predict_intentions" in weights and not all(os.path.exists(path) for path in registry.paths.values()):
+        print("fastText model files not found, leaving predict_intentions out of the mix")
+        del weights["predict_intentions"]
+
+    setup_test_environment()
+    call_command("migrate", verbosity=0)
+    emails, owners = generate(args)
+    virtual_users = [
+        VirtualUser(user, labs, emails, random.Random(args.seed * 1000 + i))
+        for i, (user, labs) in enumerate(owners)
+    ]
+
+    elapsed, endpoints, total = drive(virtual_users, weights, args)
+    result = {
+        "started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "config": {**{key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+                   "weights": weights},
+        "elapsed_seconds": elapsed,
+        "endpoints": endpoints,
+        "total": total,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nSaved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
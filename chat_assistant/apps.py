@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ChatAssistantConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "chat_assistant"
+
+    def ready(self):
+        # Models load lazily on first prediction unless warmup is requested,
+        # e.g. in a gunicorn --preload master so workers share one copy
+        if getattr(settings, "CHAT_WARMUP_MODELS", False):
+            from .registry import registry
+            registry.warmup()
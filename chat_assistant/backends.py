@@ -0,0 +1,217 @@
+import abc
+import asyncio
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing.connection import Client
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import inference
+from .registry import registry
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceBackend(abc.ABC):
+    """
+    Runs ``inference.predict_batch`` somewhere and hands back a Future.
+
+    Subclasses decide where: in the calling thread, in a thread pool, or on
+    the inference server shared by all HTTP workers. Views call ``submit`` and
+    wait on the Future (or wrap it for asyncio).
+    """
+
+    name = None
+
+    def __init__(self, top_k=5, workers=1):
+        self.top_k = top_k
+        self.workers = workers
+        self._lock = threading.Lock()
+        self.submitted = 0
+
+    def submit(self, messages):
+        with self._lock:
+            self.submitted += 1
+        return self._submit(list(messages))
+
+    @abc.abstractmethod
+    def _submit(self, messages):
+        """Start predicting ``messages`` and return a Future of the results."""
+
+    def predict(self, messages):
+        """Submit ``messages`` and block until their predictions are ready."""
+        return self.submit(messages).result()
+
+    async def apredict(self, messages):
+        """Async counterpart of ``predict`` that does not block the event loop."""
+        return await asyncio.wrap_future(self.submit(messages))
+
+    def reload(self):
+        """Load the models again from disk on next use."""
+        registry.unload()
+
+    def shutdown(self):
+        pass
+
+    def stats(self):
+        return {'backend': self.name, 'workers': self.workers, 'submitted': self.submitted}
+
+
+class InlineBackend(InferenceBackend):
+    """Predicts in the calling thread; the returned Future is already done."""
+
+    name = 'inline'
+
+    def _submit(self, messages):
+        future = Future()
+        try:
+            future.set_result(inference.predict_batch(messages, self.top_k))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    async def apredict(self, messages):
+        # Inline prediction would run on the event loop, so move it to a thread
+        return await sync_to_async(self.predict, thread_sensitive=False)(messages)
+
+
+class ThreadPoolBackend(InferenceBackend):
+    """Predicts on a thread pool that shares this process's models."""
+
+    name = 'thread'
+
+    def __init__(self, top_k=5, workers=1):
+        super().__init__(top_k, workers)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='chat-inference')
+
+    def _submit(self, messages):
+        return self._executor.submit(inference.predict_batch, messages, self.top_k)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _warmup_worker():
+    from .registry import registry
+    registry.warmup()
+
+
+class ProcessPoolBackend(InferenceBackend):
+    """
+    Predicts in dedicated worker processes, each of which loads the models
+    once when it starts, so inference is not limited by one process's GIL.
+    The inference server runs one of these for all HTTP workers (see
+    InferenceServerBackend).
+    """
+
+    name = 'process-pool'
+
+    def __init__(self, top_k=5, workers=1, start_method='spawn'):
+        super().__init__(top_k, workers)
+        self.start_method = start_method
+        self._executor = self._new_executor()
+
+    def _new_executor(self):
+        # Forking a threaded server is unsafe, so workers are spawned by default
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context(self.start_method),
+            initializer=_warmup_worker,
+        )
+
+    def _submit(self, messages):
+        return self._executor.submit(inference.predict_batch, messages, self.top_k)
+
+    def reload(self):
+        # The workers hold their own copies of the models, so replace them;
+        # predictions already queued finish on the old workers
+        executor, self._executor = self._executor, self._new_executor()
+        executor.shutdown(wait=False)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class InferenceServerBackend(InferenceBackend):
+    """
+    Sends predictions to the inference server (manage.py run_inference_server),
+    whose process pool is shared by every HTTP worker. HTTP workers hold no
+    copy of the models, and the server's pool is sized on its own. ``workers``
+    threads wait on the server here; each opens its own connection on first
+    use and again after the server restarts.
+    """
+
+    name = 'process'
+
+    def __init__(self, top_k=5, workers=1, address=('127.0.0.1', 8765), authkey=b''):
+        super().__init__(top_k, workers)
+        self.address = address
+        self.authkey = authkey
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='chat-inference')
+
+    def _call(self, method, *args):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = Client(self.address, authkey=self.authkey)
+        try:
+            connection.send((method, args))
+            ok, result = connection.recv()
+        except (EOFError, OSError):
+            connection.close()
+            self._local.connection = None
+            raise
+        if not ok:
+            raise result
+        return result
+
+    def _submit(self, messages):
+        return self._executor.submit(self._call, 'predict_batch', messages)
+
+    def reload(self):
+        # The server reloads once per change of the model files, however many
+        # HTTP workers ask
+        try:
+            self._call('reload')
+        except (EOFError, OSError):
+            logger.warning('Could not ask the inference server at %s:%s to reload the models', *self.address)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (InlineBackend, ThreadPoolBackend, InferenceServerBackend)
+}
+
+
+def server_address():
+    """The (host, port) of the inference server, from CHAT_INFERENCE_SERVER."""
+    host, _, port = getattr(settings, 'CHAT_INFERENCE_SERVER', '127.0.0.1:8765').rpartition(':')
+    return host, int(port)
+
+
+def server_authkey():
+    # Clients and server share the settings, so the secret key authenticates both
+    return settings.SECRET_KEY.encode()
+
+
+def create_backend():
+    """Build the backend selected by CHAT_INFERENCE_BACKEND."""
+    name = getattr(settings, 'CHAT_INFERENCE_BACKEND', 'inline')
+    try:
+        backend_class = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown CHAT_INFERENCE_BACKEND {name!r}, expected one of {sorted(BACKENDS)}")
+    kwargs = {}
+    if backend_class is InferenceServerBackend:
+        kwargs = {'address': server_address(), 'authkey': server_authkey()}
+    return backend_class(
+        top_k=getattr(settings, 'CHAT_MAX_TOP_K', 5),
+        workers=getattr(settings, 'CHAT_INFERENCE_WORKERS', 1),
+        **kwargs,
+    )
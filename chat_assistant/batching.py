@@ -0,0 +1,169 @@
+import functools
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Collects messages submitted by concurrent requests and runs them through
+    ``predict_batch`` together.
+
+    A batch is flushed as soon as ``max_batch_size`` messages are waiting or
+    ``max_wait_ms`` milliseconds have passed since the first one arrived,
+    whichever comes first. ``predict_batch`` receives a list of messages and
+    must return a list of results in the same order, or a Future that
+    resolves to one.
+    """
+
+    def __init__(self, predict_batch, max_batch_size=64, max_wait_ms=5.0):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+
+    def submit(self, message, timeout=30.0):
+        """
+        Queue ``message`` and block until its batch has been predicted, for at
+        most ``timeout`` seconds (TimeoutError).
+        """
+        future = self.submit_async(message)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            # Only takes effect if its batch has not started yet
+            future.cancel()
+            raise
+
+    def submit_async(self, message):
+        """Queue ``message`` and return a Future for its result."""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((message, future, time.monotonic()))
+        return future
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name="chat-micro-batcher", daemon=True
+                )
+                self._worker.start()
+
+    def _collect(self):
+        # Block for the first item, then keep draining until the batch is full
+        # or the wait window that started with the first item has closed.
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Drop requests cancelled while queued (timed out, or an async
+            # view whose client went away). The rest are marked running, which
+            # makes them uncancellable, so their results can always be set.
+            batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            started = time.monotonic()
+            try:
+                outcome = self.predict_batch([message for message, _, _ in batch])
+            except Exception as e:
+                self._finish(batch, started, error=e)
+                continue
+            if isinstance(outcome, Future):
+                # Asynchronous backends resolve the batch once their worker is
+                # done, so several batches can be in flight at the same time
+                outcome.add_done_callback(functools.partial(self._finish_future, batch, started))
+            else:
+                self._finish(batch, started, results=outcome)
+
+    def _finish_future(self, batch, started, future):
+        try:
+            results = future.result()
+        except Exception as e:
+            self._finish(batch, started, error=e)
+        else:
+            self._finish(batch, started, results=results)
+
+    def _finish(self, batch, started, results=None, error=None):
+        if error is not None:
+            logger.error("Batched prediction failed for %d messages", len(batch), exc_info=error)
+            for _, future, _ in batch:
+                future.set_exception(error)
+        else:
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+        self._record(batch, started, time.monotonic() - started)
+
+    def _record(self, batch, started, predict_seconds):
+        waits = [started - enqueued for _, _, enqueued in batch]
+        size = len(batch)
+        # Bucket batch sizes by powers of two: 1, 2, 4, ... max_batch_size.
+        bucket = 1
+        while bucket < size:
+            bucket *= 2
+        with self._stats_lock:
+            self._batches += 1
+            self._items += size
+            self._max_batch_size_seen = max(self._max_batch_size_seen, size)
+            self._batch_size_histogram[bucket] = self._batch_size_histogram.get(bucket, 0) + 1
+            self._queue_wait_total += sum(waits)
+            self._queue_wait_max = max(self._queue_wait_max, max(waits))
+            self._predict_total += predict_seconds
+        logger.debug(
+            "Predicted batch of %d messages in %.2f ms (max queue wait %.2f ms)",
+            size, predict_seconds * 1000, max(waits) * 1000,
+        )
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._batches = 0
+            self._items = 0
+            self._max_batch_size_seen = 0
+            self._batch_size_histogram = {}
+            self._queue_wait_total = 0.0
+            self._queue_wait_max = 0.0
+            self._predict_total = 0.0
+
+    def stats(self):
+        """Return batch-size and queue-wait metrics collected so far."""
+        with self._stats_lock:
+            batches = self._batches
+            items = self._items
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "batches": batches,
+                "items": items,
+                "queued": self._queue.qsize(),
+                "mean_batch_size": items / batches if batches else 0.0,
+                "max_batch_size_seen": self._max_batch_size_seen,
+                "batch_size_histogram": {
+                    str(bucket): count for bucket, count in sorted(self._batch_size_histogram.items())
+                },
+                "mean_queue_wait_ms": self._queue_wait_total / items * 1000 if items else 0.0,
+                "max_queue_wait_ms": self._queue_wait_max * 1000,
+                "mean_predict_ms": self._predict_total / batches * 1000 if batches else 0.0,
+                "queue_wait_seconds_total": self._queue_wait_total,
+                "predict_seconds_total": self._predict_total,
+            }
@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+EVICTION_POLICIES = ('lru', 'fifo')
+
+
+def normalize_message(message):
+    """Case-fold and collapse whitespace so trivially different repeats share a key."""
+    return ' '.join(message.casefold().split())
+
+
+def file_signature(paths):
+    """Modification time and size of each of ``paths``, None for a missing one."""
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+
+class PredictionCache:
+    """
+    Bounded in-process cache of predictions keyed on normalized message text.
+
+    ``policy`` decides which entry is evicted once ``max_size`` is reached:
+    ``'lru'`` drops the least recently used entry and ``'fifo'`` the oldest
+    inserted one. Entries older than ``ttl`` seconds are treated as misses
+    (``ttl=None`` keeps them until evicted). The whole cache is cleared when the
+    modification time or size of any file in ``watch_paths`` changes, checked
+    at most once every ``check_interval`` seconds, and ``on_invalidate`` is
+    then called so that the models can be reloaded from the new files.
+
+    Each clear starts a new ``generation``. Callers read it before predicting
+    and pass it to ``set``, so predictions made by a model that was replaced in
+    the meantime are not stored.
+    """
+
+    def __init__(self, max_size=10000, ttl=None, policy='lru', watch_paths=(), check_interval=1.0,
+                 on_invalidate=None):
+        if policy not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy {policy!r}, expected one of {EVICTION_POLICIES}")
+        self.max_size = max_size
+        self.ttl = ttl
+        self.policy = policy
+        self.watch_paths = tuple(watch_paths)
+        self.check_interval = check_interval
+        self.on_invalidate = on_invalidate
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._signature = file_signature(self.watch_paths)
+        self._next_check = time.monotonic() + check_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _check_files(self, now):
+        # Called with the lock held, so no caller can read the new generation
+        # before the models have been reloaded
+        if not self.watch_paths or now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        signature = file_signature(self.watch_paths)
+        if signature != self._signature:
+            self._signature = signature
+            self._entries.clear()
+            if self.on_invalidate is not None:
+                self.on_invalidate()
+            self.generation += 1
+            self.invalidations += 1
+
+    def get(self, message):
+        """Return the cached prediction for ``message`` or None."""
+        key = normalize_message(message)
+        now = time.monotonic()
+        with self._lock:
+            self._check_files(now)
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and now - entry[1] > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            if self.policy == 'lru':
+                self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, message, prediction, generation=None):
+        """Store ``prediction`` unless the cache was cleared since ``generation``."""
+        key = normalize_message(message)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            if key in self._entries:
+                del self._entries[key]
+            self._entries[key] = (prediction, time.monotonic())
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'policy': self.policy,
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl,
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
@@ -0,0 +1,34 @@
+from .registry import registry
+
+
+def _ranked(labels, confidences):
+    # fastText can report probabilities a hair above 1.0; clamp them
+    return [
+        (label.replace('__label__', ''), min(float(confidence), 1.0))
+        for label, confidence in zip(labels, confidences)
+    ]
+
+
+def predict_batch(messages, k=5):
+    """
+    Run each model once over the whole list of messages and return, per
+    message and in the same order, the top ``k`` (label, probability) pairs of
+    each model.
+
+    This module does not touch Django settings so that inference worker
+    processes can import it without configuring Django.
+    """
+    # fastText predicts one line per input, so newlines must not reach it
+    messages = [message.replace('\n', ' ') for message in messages]
+    # Models are loaded on first use and shared by all threads
+    general_labels, general_confidences = registry.get('general').predict(messages, k=k)
+    object_labels, object_confidences = registry.get('object').predict(messages, k=k)
+
+    return [
+        {
+            'general': _ranked(general_label, general_confidence),
+            'object': _ranked(object_label, object_confidence),
+        }
+        for general_label, general_confidence, object_label, object_confidence
+        in zip(general_labels, general_confidences, object_labels, object_confidences)
+    ]
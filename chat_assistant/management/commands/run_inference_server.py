@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from chat_assistant.server import create_server
+
+
+class Command(BaseCommand):
+    help = (
+        'Run the inference server that every HTTP worker sends predictions to when '
+        'CHAT_INFERENCE_BACKEND is "process". It listens on CHAT_INFERENCE_SERVER.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Inference processes, each holding one copy of the models (default: CHAT_INFERENCE_WORKERS).',
+        )
+
+    def handle(self, *args, **options):
+        server = create_server(workers=options['workers'])
+        host, port = server.address
+        self.stdout.write(f'Serving predictions on {host}:{port} with {server.backend.workers} inference processes')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
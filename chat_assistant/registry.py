@@ -0,0 +1,73 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+GENERAL_MODEL_PATH = "./models/general_intent_model.bin"
+OBJECT_MODEL_PATH = "./models/object_intent_model.bin"
+
+
+class ModelRegistry:
+    """
+    Loads fastText models on first use and shares them between threads.
+
+    Nothing is read from disk at import time, so processes that never serve
+    /chat/ (auth-only workers, manage.py commands, test runs) never pay for the
+    models. Call ``warmup()`` to load everything up front instead; doing that
+    before the server forks its workers (gunicorn ``--preload``) lets every
+    worker share the parent's copy of the model pages.
+    """
+
+    def __init__(self, paths):
+        self.paths = dict(paths)
+        self._models = {}
+        self._load_seconds = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        model = self._models.get(name)
+        if model is None:
+            with self._lock:
+                model = self._models.get(name)
+                if model is None:
+                    model = self._load(name)
+        return model
+
+    def _load(self, name):
+        # Imported here so that importing this module stays cheap
+        import fasttext
+
+        started = time.perf_counter()
+        model = fasttext.load_model(self.paths[name])
+        self._load_seconds[name] = time.perf_counter() - started
+        self._models[name] = model
+        logger.info("Loaded %s model from %s in %.2f s", name, self.paths[name], self._load_seconds[name])
+        return model
+
+    def warmup(self):
+        """Load every registered model now rather than on first request."""
+        for name in self.paths:
+            self.get(name)
+
+    def unload(self):
+        """Drop the loaded models; they are loaded again on next use."""
+        with self._lock:
+            self._models.clear()
+            self._load_seconds.clear()
+
+    def stats(self):
+        return {
+            name: {
+                'path': str(path),
+                'loaded': name in self._models,
+                'load_seconds': self._load_seconds.get(name),
+            }
+            for name, path in self.paths.items()
+        }
+
+
+registry = ModelRegistry({
+    'general': GENERAL_MODEL_PATH,
+    'object': OBJECT_MODEL_PATH,
+})
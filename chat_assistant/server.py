@@ -0,0 +1,115 @@
+import logging
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+from django.conf import settings
+
+from .backends import ProcessPoolBackend, server_address, server_authkey
+from .cache import file_signature
+from .registry import GENERAL_MODEL_PATH, OBJECT_MODEL_PATH
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceServer:
+    """
+    Serves ``backend`` to the InferenceServerBackend of every HTTP worker, so
+    all of them share one pool of inference processes and one copy of the
+    models per pool worker.
+
+    Each client connection is handled by its own thread and sends
+    ``(method, args)`` tuples; the reply is ``(True, result)`` or
+    ``(False, exception)``. ``reload`` replaces the backend's workers only when
+    a file in ``watch_paths`` changed since the last reload, since every HTTP
+    worker asks once it notices the change.
+    """
+
+    METHODS = ('predict_batch', 'reload', 'stats')
+
+    def __init__(self, backend, address, authkey, watch_paths=()):
+        self.backend = backend
+        self.watch_paths = tuple(watch_paths)
+        self._authkey = authkey
+        self._signature = file_signature(self.watch_paths)
+        self._lock = threading.Lock()
+        self._listener = Listener(address, authkey=authkey)
+        self._closed = False
+        self.address = self._listener.address
+        self.reloads = 0
+
+    def predict_batch(self, messages):
+        return self.backend.predict(messages)
+
+    def reload(self):
+        with self._lock:
+            signature = file_signature(self.watch_paths)
+            if signature == self._signature:
+                return False
+            self._signature = signature
+            self.backend.reload()
+            self.reloads += 1
+            return True
+
+    def stats(self):
+        return {**self.backend.stats(), 'reloads': self.reloads}
+
+    def serve_forever(self):
+        while True:
+            try:
+                connection = self._listener.accept()
+            except AuthenticationError:
+                logger.warning('Rejected an inference client with the wrong key')
+                continue
+            except OSError:
+                if self._closed:
+                    return
+                raise
+            if self._closed:
+                connection.close()
+                return
+            threading.Thread(target=self._serve_client, args=(connection,), daemon=True).start()
+
+    def _serve_client(self, connection):
+        with connection:
+            while True:
+                try:
+                    method, args = connection.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    if method not in self.METHODS:
+                        raise ValueError(f'Unknown inference server method {method!r}')
+                    reply = (True, getattr(self, method)(*args))
+                except Exception as e:
+                    reply = (False, e)
+                try:
+                    connection.send(reply)
+                except OSError:
+                    return
+                except Exception as e:
+                    # An exception or result that cannot be pickled
+                    connection.send((False, RuntimeError(f'{type(e).__name__}: {e}')))
+
+    def close(self):
+        """Stop serve_forever and the backend's workers."""
+        self._closed = True
+        # accept() does not return when the listener is closed from another
+        # thread, so wake it with a connection of our own
+        try:
+            Client(self.address, authkey=self._authkey).close()
+        except OSError:
+            pass
+        self._listener.close()
+        self.backend.shutdown()
+
+
+def create_server(workers=None):
+    """An InferenceServer on CHAT_INFERENCE_SERVER with CHAT_INFERENCE_WORKERS processes."""
+    backend = ProcessPoolBackend(
+        top_k=getattr(settings, 'CHAT_MAX_TOP_K', 5),
+        workers=workers or getattr(settings, 'CHAT_INFERENCE_WORKERS', 1),
+    )
+    return InferenceServer(
+        backend, server_address(), server_authkey(), watch_paths=[GENERAL_MODEL_PATH, OBJECT_MODEL_PATH]
+    )
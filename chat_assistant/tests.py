@@ -1,3 +1,354 @@
-from django.test import TestCase
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import AuthenticationError
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from .backends import (
+    InferenceBackend, InferenceServerBackend, InlineBackend, ProcessPoolBackend, ThreadPoolBackend, create_backend,
+)
+
+from .batching import MicroBatcher
+from .cache import PredictionCache
+from .registry import registry
+from .server import InferenceServer
+from .views import prediction_cache
+
+
+class PredictIntentionsValidationTests(TestCase):
+    # Requests rejected before inference, so no model has to be loaded
+
+    def post(self, body, path='/chat/predict_intentions/'):
+        return self.client.post(path, body, content_type='application/json')
+
+    def test_rejects_bad_requests(self):
+        self.assertEqual(self.client.get('/chat/predict_intentions/').json(), {'error': 'Invalid request method'})
+        self.assertEqual(self.post('{"message": ').json(), {'error': 'Invalid JSON'})
+        self.assertEqual(self.post({'message': '  '}).json(), {'error': 'No message provided'})
+
+        response = self.post({'message': 'hi', 'k': 99})
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.json()['error'].startswith('k must be an integer'))
+        for k in (0, True, 1.5, '2'):
+            self.assertEqual(self.post({'message': 'hi', 'k': k}).status_code, 400)
+        for threshold in (-0.1, 1.1, False, '0.5'):
+            response = self.post({'message': 'hi', 'threshold': threshold})
+            self.assertEqual(response.json(), {'error': 'threshold must be a number between 0 and 1'})
+
+    def test_batch_limits(self):
+        with self.settings(CHAT_BULK_MAX_MESSAGES=2):
+            response = self.post(['a', 'b', 'c'], path='/chat/predict_intentions_batch/')
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(self.post({'messages': ['a', 3]}, path='/chat/predict_intentions_batch/').status_code, 400)
+
+
+class StubModel:
+    """Stands in for a fastText model, ranking the same labels for every message."""
+
+    def __init__(self, *ranked):
+        self.ranked = ranked
+
+    def predict(self, messages, k=1):
+        top = self.ranked[:k]
+        return [[f'__label__{label}' for label, _ in top] for _ in messages], [[p for _, p in top] for _ in messages]
+
+
+class PredictIntentionsTests(TestCase):
+    def setUp(self):
+        registry._models.update({
+            'general': StubModel(('question', 0.7), ('greeting', 0.2), ('complaint', 0.1)),
+            'object': StubModel(('oven', 0.4), ('thermometer', 0.35)),
+        })
+        self.addCleanup(registry.unload)
+        prediction_cache.clear()
+
+    def predict(self, **body):
+        return self.client.post('/chat/predict_intentions/', body, content_type='application/json').json()
+
+    def test_default_is_best_label_of_each_model(self):
+        result = self.predict(message='where is the oven?')
+        self.assertEqual(result['general_intention'], 'question')
+        self.assertEqual(result['general_confidence'], 0.7)
+        self.assertEqual(result['object_intentions'], [{'intention': 'oven', 'confidence': 0.4}])
+        self.assertFalse(result['abstain'])
+
+    def test_top_k(self):
+        result = self.predict(message='where is the oven?', k=2)
+        self.assertEqual([i['intention'] for i in result['general_intentions']], ['question', 'greeting'])
+        self.assertEqual([i['intention'] for i in result['object_intentions']], ['oven', 'thermometer'])
+
+    def test_threshold_filters_and_abstains(self):
+        result = self.predict(message='where is the oven?', k=3, threshold=0.5)
+        self.assertEqual(result['general_intentions'], [{'intention': 'question', 'confidence': 0.7}])
+        self.assertEqual(result['object_intentions'], [])
+        self.assertIsNone(result['object_intention'])
+        self.assertIsNone(result['object_confidence'])
+        self.assertTrue(result['abstain'])
+
+    def test_batch_endpoint_formats_each_message(self):
+        response = self.client.post('/chat/predict_intentions_batch/', {
+            'messages': ['a', 'b'], 'k': 2, 'threshold': 0.3,
+        }, content_type='application/json')
+        predictions = response.json()['predictions']
+        self.assertEqual(len(predictions), 2)
+        self.assertEqual([i['intention'] for i in predictions[0]['object_intentions']], ['oven', 'thermometer'])
+        self.assertEqual(predictions[0]['general_intentions'], [{'intention': 'question', 'confidence': 0.7}])
+
+
+class InferenceBackendTests(SimpleTestCase):
+    def setUp(self):
+        registry._models.update({
+            'general': StubModel(('question', 0.7), ('greeting', 0.2)),
+            'object': StubModel(('oven', 0.4)),
+        })
+        self.addCleanup(registry.unload)
+
+    def check_backend(self, backend):
+        self.addCleanup(backend.shutdown)
+        expected = [{'general': [('question', 0.7), ('greeting', 0.2)], 'object': [('oven', 0.4)]}] * 2
+        self.assertEqual(backend.predict(['a', 'b']), expected)
+        self.assertEqual(async_to_sync(backend.apredict)(['a', 'b']), expected)
+        self.assertEqual(backend.stats()['submitted'], 2)
+
+    def test_inline(self):
+        self.check_backend(InlineBackend(top_k=2))
+
+    def test_thread_pool(self):
+        self.check_backend(ThreadPoolBackend(top_k=2, workers=2))
+
+    def test_errors_reach_the_caller(self):
+        registry._models['object'] = mock.Mock(**{'predict.side_effect': RuntimeError('corrupt model')})
+        for backend in (InlineBackend(), ThreadPoolBackend()):
+            self.addCleanup(backend.shutdown)
+            with self.assertRaisesMessage(RuntimeError, 'corrupt model'):
+                backend.predict(['a'])
+
+    def test_reload_unloads_models(self):
+        InlineBackend().reload()
+        self.assertEqual(registry._models, {})
+
+    def test_process_pool_reload_replaces_workers(self):
+        # No worker is spawned until something is submitted
+        backend = ProcessPoolBackend()
+        self.addCleanup(backend.shutdown)
+        executor = backend._executor
+        backend.reload()
+        self.assertIsNot(backend._executor, executor)
+
+    def test_create_backend(self):
+        with override_settings(CHAT_INFERENCE_BACKEND='thread', CHAT_INFERENCE_WORKERS=3):
+            backend = create_backend()
+        self.addCleanup(backend.shutdown)
+        self.assertEqual((backend.name, backend.workers), ('thread', 3))
+        with override_settings(CHAT_INFERENCE_BACKEND='process', CHAT_INFERENCE_SERVER='localhost:9000'):
+            backend = create_backend()
+        self.addCleanup(backend.shutdown)
+        self.assertEqual((backend.name, backend.address), ('process', ('localhost', 9000)))
+        with override_settings(CHAT_INFERENCE_BACKEND='gpu'), self.assertRaises(ValueError):
+            create_backend()
+        with self.assertRaises(TypeError):
+            InferenceBackend()
+
+
+class InferenceServerTests(SimpleTestCase):
+    # The server runs in a thread of the test process, with a thread pool in
+    # place of its inference processes so that it sees the stub models
+
+    def setUp(self):
+        registry._models.update({
+            'general': StubModel(('question', 0.7), ('greeting', 0.2)),
+            'object': StubModel(('oven', 0.4)),
+        })
+        self.addCleanup(registry.unload)
+        fd, self.model_path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, self.model_path)
+
+        self.server = InferenceServer(
+            ThreadPoolBackend(top_k=2, workers=2), ('127.0.0.1', 0), b'secret', watch_paths=[self.model_path]
+        )
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        self.addCleanup(self.server.close)
+
+    def http_worker(self, authkey=b'secret'):
+        backend = InferenceServerBackend(workers=2, address=self.server.address, authkey=authkey)
+        self.addCleanup(backend.shutdown)
+        return backend
+
+    def test_http_workers_share_the_server(self):
+        expected = [{'general': [('question', 0.7), ('greeting', 0.2)], 'object': [('oven', 0.4)]}] * 2
+        first, second = self.http_worker(), self.http_worker()
+        self.assertEqual(first.predict(['a', 'b']), expected)
+        self.assertEqual(async_to_sync(second.apredict)(['a', 'b']), expected)
+        self.assertEqual(self.server.stats()['submitted'], 2)
+
+    def test_errors_reach_the_caller(self):
+        registry._models['object'] = mock.Mock(**{'predict.side_effect': RuntimeError('corrupt model')})
+        with self.assertRaisesMessage(RuntimeError, 'corrupt model'):
+            self.http_worker().predict(['a'])
+
+    def test_wrong_key_is_rejected(self):
+        with self.assertLogs('chat_assistant.server', 'WARNING') as logs:
+            with self.assertRaises(AuthenticationError):
+                self.http_worker(authkey=b'guess').predict(['a'])
+            # The server logs from its own thread
+            for _ in range(100):
+                if logs.records:
+                    break
+                time.sleep(0.01)
+
+    def test_reloads_once_per_model_file_change(self):
+        first, second = self.http_worker(), self.http_worker()
+        first.reload()
+        self.assertEqual(self.server.reloads, 0)
+
+        with open(self.model_path, 'w') as f:
+            f.write('new model')
+        first.reload()
+        second.reload()
+        self.assertEqual(self.server.reloads, 1)
+        self.assertEqual(registry._models, {})
+
+
+class MicroBatcherTests(SimpleTestCase):
+    def setUp(self):
+        self.batches = []
+
+    def predict_batch(self, messages):
+        self.batches.append(messages)
+        return [message.upper() for message in messages]
+
+    def test_full_batch_is_flushed_without_waiting(self):
+        batcher = MicroBatcher(self.predict_batch, max_batch_size=3, max_wait_ms=10000)
+        futures = [batcher.submit_async(message) for message in ['a', 'b', 'c']]
+        self.assertEqual([future.result(timeout=1) for future in futures], ['A', 'B', 'C'])
+        self.assertEqual(self.batches, [['a', 'b', 'c']])
+
+    def test_partial_batch_is_flushed_after_window(self):
+        batcher = MicroBatcher(self.predict_batch, max_batch_size=64, max_wait_ms=50)
+        futures = [batcher.submit_async(message) for message in ['a', 'b']]
+        self.assertEqual([future.result(timeout=1) for future in futures], ['A', 'B'])
+        self.assertEqual(self.batches, [['a', 'b']])
+
+        stats = batcher.stats()
+        self.assertEqual((stats['batches'], stats['items'], stats['queued']), (1, 2, 0))
+        self.assertEqual(stats['batch_size_histogram'], {'2': 1})
+
+    def test_results_keep_submission_order_across_batches(self):
+        batcher = MicroBatcher(self.predict_batch, max_batch_size=2, max_wait_ms=50)
+        messages = [f'm{i}' for i in range(5)]
+        futures = [batcher.submit_async(message) for message in messages]
+        self.assertEqual([future.result(timeout=1) for future in futures], [m.upper() for m in messages])
+        self.assertEqual([len(batch) for batch in self.batches], [2, 2, 1])
+
+    def test_error_reaches_every_request_in_the_batch(self):
+        def fail(messages):
+            raise RuntimeError('model exploded')
+
+        batcher = MicroBatcher(fail, max_batch_size=2, max_wait_ms=50)
+        with self.assertLogs('chat_assistant.batching', 'ERROR'):
+            futures = [batcher.submit_async(message) for message in ['a', 'b']]
+            for future in futures:
+                with self.assertRaisesMessage(RuntimeError, 'model exploded'):
+                    future.result(timeout=1)
+        # The worker survives and serves the next batch
+        batcher.predict_batch = self.predict_batch
+        self.assertEqual(batcher.submit('c', timeout=1), 'C')
+
+    def test_cancelled_request_is_skipped(self):
+        batcher = MicroBatcher(self.predict_batch, max_batch_size=64, max_wait_ms=50)
+        cancelled = batcher.submit_async('a')
+        self.assertTrue(cancelled.cancel())
+        self.assertEqual(batcher.submit_async('b').result(timeout=1), 'B')
+        self.assertEqual(self.batches, [['b']])
+
+    def test_cancelling_a_running_request_does_not_break_its_batch(self):
+        started, release = threading.Event(), threading.Event()
+
+        def predict_batch(messages):
+            started.set()
+            release.wait(1)
+            return self.predict_batch(messages)
+
+        batcher = MicroBatcher(predict_batch, max_batch_size=2, max_wait_ms=1000)
+        first, second = batcher.submit_async('a'), batcher.submit_async('b')
+        started.wait(1)
+        self.assertFalse(first.cancel())
+        release.set()
+        self.assertEqual((first.result(timeout=1), second.result(timeout=1)), ('A', 'B'))
+
+    def test_submit_times_out(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        batcher = MicroBatcher(lambda messages: release.wait(1) and messages, max_batch_size=1, max_wait_ms=0)
+        with self.assertRaises(TimeoutError):
+            batcher.submit('a', timeout=0.05)
+
+    def test_predict_batch_may_return_a_future(self):
+        pending = Future()
+        batcher = MicroBatcher(lambda messages: pending, max_batch_size=1, max_wait_ms=0)
+        future = batcher.submit_async('a')
+        self.assertFalse(future.done())
+        threading.Timer(0.01, pending.set_result, [['A']]).start()
+        self.assertEqual(future.result(timeout=1), 'A')
+
+
+class PredictionCacheTests(SimpleTestCase):
+    def test_keys_are_normalized(self):
+        cache = PredictionCache()
+        cache.set('Where is the  OVEN?', 'p')
+        self.assertEqual(cache.get(' where is the oven? '), 'p')
+        self.assertIsNone(cache.get('where is the oven'))
+
+    def test_lru_keeps_recently_read_entries(self):
+        cache = PredictionCache(max_size=2, policy='lru')
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_fifo_evicts_oldest_insert(self):
+        cache = PredictionCache(max_size=2, policy='fifo')
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (None, 2, 3))
+
+    def test_entries_expire_after_ttl(self):
+        cache = PredictionCache(ttl=10)
+        with mock.patch('chat_assistant.cache.time.monotonic', return_value=100.0):
+            cache.set('a', 1)
+        with mock.patch('chat_assistant.cache.time.monotonic', return_value=105.0):
+            self.assertEqual(cache.get('a'), 1)
+        with mock.patch('chat_assistant.cache.time.monotonic', return_value=111.0):
+            self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['expirations'], 1)
+
+    def test_changed_model_file_clears_cache_and_reloads(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        reload = mock.Mock()
+        cache = PredictionCache(watch_paths=[path], check_interval=0, on_invalidate=reload)
+        cache.set('a', 1)
+        generation = cache.generation
+
+        with open(path, 'w') as f:
+            f.write('new model')
+        self.assertIsNone(cache.get('a'))
+        reload.assert_called_once_with()
+        # A prediction started before the change is not stored
+        cache.set('a', 1, generation)
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', 2, cache.generation)
+        self.assertEqual(cache.get('a'), 2)
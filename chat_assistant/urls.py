@@ -1,6 +1,13 @@
+from django.conf import settings
 from django.urls import path
-from .views import predict_intentions
+from .views import predict_intentions, predict_intentions_async, predict_intentions_batch, inference_stats
+
+# Under ASGI the hot endpoint is served by its native async view
+if settings.ASYNC_VIEWS:
+    predict_intentions = predict_intentions_async
 
 urlpatterns = [
     path('predict_intentions/', predict_intentions, name='predict_intentions'),
+    path('predict_intentions_batch/', predict_intentions_batch, name='predict_intentions_batch'),
+    path('inference_stats/', inference_stats, name='inference_stats'),
 ]
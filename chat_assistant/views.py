@@ -1,40 +1,177 @@
-from django.http import JsonResponse
+from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
-import json
-import fasttext
+import asyncio
+from mysite.api import ApiError, Field, api_view
+from mysite.instrumentation import timing
+from .batching import MicroBatcher
+from .cache import PredictionCache
+from .backends import create_backend
+from .registry import registry, GENERAL_MODEL_PATH, OBJECT_MODEL_PATH
 
-# Load the models
-GENERAL_MODEL_PATH = "./models/general_intent_model.bin"
-OBJECT_MODEL_PATH = "./models/object_intent_model.bin"
-general_model = fasttext.load_model(GENERAL_MODEL_PATH)
-object_model = fasttext.load_model(OBJECT_MODEL_PATH)
+
+def format_prediction(prediction, k=1, threshold=0.0):
+    """
+    Keep the top ``k`` labels of each model whose probability is at least
+    ``threshold``. If either model has nothing left, the result abstains so the
+    client knows a rephrased follow-up will not help.
+    """
+    result = {}
+    for model_name in ('general', 'object'):
+        ranked = [
+            {'intention': label, 'confidence': confidence}
+            for label, confidence in prediction[model_name][:k]
+            if confidence >= threshold
+        ]
+        result[f'{model_name}_intention'] = ranked[0]['intention'] if ranked else None
+        result[f'{model_name}_confidence'] = ranked[0]['confidence'] if ranked else None
+        result[f'{model_name}_intentions'] = ranked
+    result['abstain'] = result['general_intention'] is None or result['object_intention'] is None
+    return result
+
+
+def parse_top_k(body):
+    """Read and validate the optional ``k`` and ``threshold`` request fields."""
+    max_k = getattr(settings, 'CHAT_MAX_TOP_K', 5)
+    k = body.get('k', 1)
+    threshold = body.get('threshold', 0.0)
+    if isinstance(k, bool) or not isinstance(k, int) or not 1 <= k <= max_k:
+        raise ApiError(f'k must be an integer between 1 and {max_k}')
+    if isinstance(threshold, bool) or not isinstance(threshold, (int, float)) or not 0.0 <= threshold <= 1.0:
+        raise ApiError('threshold must be a number between 0 and 1')
+    return k, float(threshold)
+
+
+# Where inference runs: in the request thread, a thread pool or worker processes
+backend = create_backend()
+
+# Requests arriving within the same short window share one model call
+batcher = MicroBatcher(
+    backend.submit,
+    max_batch_size=getattr(settings, 'CHAT_BATCH_MAX_SIZE', 64),
+    max_wait_ms=getattr(settings, 'CHAT_BATCH_MAX_WAIT_MS', 5),
+)
+
+# Repeated questions are answered from memory; the cache empties itself and
+# the backend reloads the models whenever either model file is replaced
+prediction_cache = PredictionCache(
+    max_size=getattr(settings, 'CHAT_CACHE_MAX_SIZE', 10000),
+    ttl=getattr(settings, 'CHAT_CACHE_TTL_SECONDS', None),
+    policy=getattr(settings, 'CHAT_CACHE_EVICTION_POLICY', 'lru'),
+    watch_paths=[GENERAL_MODEL_PATH, OBJECT_MODEL_PATH],
+    on_invalidate=backend.reload,
+)
+
+
+def inference_timeout():
+    return getattr(settings, 'CHAT_INFERENCE_TIMEOUT_SECONDS', 30)
+
+
+def predict_cached(messages):
+    """
+    Like backend.predict, but messages already in the prediction cache are not
+    sent to the models. The remaining messages are predicted in one call.
+    """
+    if not getattr(settings, 'CHAT_CACHE_ENABLED', True):
+        with timing('inference'):
+            return backend.predict(messages)
+
+    predictions = [prediction_cache.get(message) for message in messages]
+    generation = prediction_cache.generation
+    missing = [i for i, prediction in enumerate(predictions) if prediction is None]
+    if missing:
+        with timing('inference'):
+            fresh = backend.predict([messages[i] for i in missing])
+        for i, prediction in zip(missing, fresh):
+            prediction_cache.set(messages[i], prediction, generation)
+            predictions[i] = prediction
+    return predictions
 
 @csrf_exempt
+@api_view('POST', schema={
+    'message': Field(str, check=str.strip, message='No message provided'),
+})
 def predict_intentions(request):
-    if request.method == 'POST':
-        try:
-            # Parse the input JSON
-            body = json.loads(request.body)
-            message = body.get('message', '').strip()
-            
-            if not message:
-                return JsonResponse({'error': 'No message provided'}, status=400)
-
-            # Predict general intent
-            general_label, general_confidence = general_model.predict(message)
-            general_intent = general_label[0].replace('__label__', '')
-
-            # Predict object intent
-            object_label, object_confidence = object_model.predict(message)
-            object_intent = object_label[0].replace('__label__', '')
-
-            # Return both predictions
-            return JsonResponse({
-                'general_intention': general_intent,
-                'general_confidence': f"{general_confidence[0]}",
-                'object_intention': object_intent,
-                'object_confidence': f"{object_confidence[0]}"
-            })
-        except json.JSONDecodeError:
-            return JsonResponse({'error': 'Invalid JSON'}, status=400)
-    return JsonResponse({'error': 'Invalid request method'}, status=405)
+    message = request.json['message'].strip()
+    k, threshold = parse_top_k(request.json)
+
+    cache_enabled = getattr(settings, 'CHAT_CACHE_ENABLED', True)
+    prediction = prediction_cache.get(message) if cache_enabled else None
+    generation = prediction_cache.generation
+
+    # Predict general and object intent, batched with concurrent requests
+    if prediction is None:
+        with timing('inference'):
+            if getattr(settings, 'CHAT_BATCHING_ENABLED', True):
+                try:
+                    prediction = batcher.submit(message, timeout=inference_timeout())
+                except TimeoutError:
+                    raise ApiError('Prediction timed out', status=503)
+            else:
+                prediction = backend.predict([message])[0]
+        if cache_enabled:
+            prediction_cache.set(message, prediction, generation)
+
+    # Return both predictions
+    return format_prediction(prediction, k, threshold)
+
+@csrf_exempt
+@api_view('POST', schema={
+    'message': Field(str, check=str.strip, message='No message provided'),
+})
+async def predict_intentions_async(request):
+    message = request.json['message'].strip()
+    k, threshold = parse_top_k(request.json)
+
+    cache_enabled = getattr(settings, 'CHAT_CACHE_ENABLED', True)
+    prediction = prediction_cache.get(message) if cache_enabled else None
+    generation = prediction_cache.generation
+
+    # Inference runs off the event loop; the request just awaits its result
+    if prediction is None:
+        with timing('inference'):
+            if getattr(settings, 'CHAT_BATCHING_ENABLED', True):
+                try:
+                    prediction = await asyncio.wait_for(
+                        asyncio.wrap_future(batcher.submit_async(message)), inference_timeout()
+                    )
+                except TimeoutError:
+                    raise ApiError('Prediction timed out', status=503)
+            else:
+                prediction = (await backend.apredict([message]))[0]
+        if cache_enabled:
+            prediction_cache.set(message, prediction, generation)
+
+    return format_prediction(prediction, k, threshold)
+
+@csrf_exempt
+@api_view('POST')
+def predict_intentions_batch(request):
+    # Accept either a bare JSON array or {"messages": [...]}
+    body = request.json
+    messages = body.get('messages') if isinstance(body, dict) else body
+    k, threshold = parse_top_k(body if isinstance(body, dict) else {})
+
+    if not isinstance(messages, list) or not messages:
+        raise ApiError('No messages provided')
+
+    max_messages = getattr(settings, 'CHAT_BULK_MAX_MESSAGES', 256)
+    if len(messages) > max_messages:
+        raise ApiError(f'At most {max_messages} messages per request', status=413)
+
+    if not all(isinstance(message, str) and message.strip() for message in messages):
+        raise ApiError('Every message must be a non-empty string')
+
+    # One vectorized call per model over the whole list, results in input order
+    predictions = predict_cached([message.strip() for message in messages])
+    return {
+        'predictions': [format_prediction(prediction, k, threshold) for prediction in predictions],
+    }
+
+@api_view('GET')
+def inference_stats(request):
+    return {
+        'models': registry.stats(),
+        'backend': backend.stats(),
+        'batching': batcher.stats(),
+        'cache': prediction_cache.stats(),
+    }
@@ -1,11 +1,62 @@
+import io
+
 from django.contrib import admin
-from .models import CustomUser, LabsActive, Collaboration
+from django.core.exceptions import PermissionDenied
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from .models import CustomUser, LabStation, LabsActive, Collaboration
+from .roster import import_roster, read_roster, roster_format
 
 @admin.register(CustomUser)
 class CustomUserAdmin(admin.ModelAdmin):
     list_display = ('email', 'first_name', 'last_name', 'is_active', 'is_staff')
     search_fields = ('email', 'first_name', 'last_name')
     ordering = ('email',)
+    change_list_template = 'admin/custom_auth/customuser/change_list.html'
+
+    def get_urls(self):
+        return [
+            path(
+                'import-roster/',
+                self.admin_site.admin_view(self.import_roster_view),
+                name='custom_auth_customuser_import_roster',
+            ),
+            *super().get_urls(),
+        ]
+
+    def import_roster_view(self, request):
+        # Same import as the import_roster management command, for an uploaded file
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+
+        upload = request.FILES.get('roster') if request.method == 'POST' else None
+        if upload is not None:
+            rows = read_roster(io.TextIOWrapper(upload.file, encoding='utf-8', newline=''), roster_format(upload.name))
+            try:
+                result = import_roster(rows)
+            except ValueError as e:
+                self.message_user(request, f'Could not import {upload.name}: {e}', level='error')
+            else:
+                self.message_user(
+                    request,
+                    f"Created {result['created']} of {result['rows']} users ({result['existing']} already existed, "
+                    f"{result['duplicates']} duplicates, {result['invalid']} invalid) in {result['seconds']:.1f}s.",
+                )
+            return redirect('admin:custom_auth_customuser_changelist')
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Import roster',
+        }
+        return TemplateResponse(request, 'admin/custom_auth/customuser/import_roster.html', context)
+
+@admin.register(LabStation)
+class LabStationAdmin(admin.ModelAdmin):
+    list_display = ('lab_id', 'name', 'position')
+    search_fields = ('lab_id', 'name')
+    ordering = ('position', 'lab_id')
 
 @admin.register(LabsActive)
 class LabsActiveAdmin(admin.ModelAdmin):
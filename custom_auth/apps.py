@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AuthConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "custom_auth"
+
+    def ready(self):
+        # Connect the cache invalidation receivers
+        from . import signals  # noqa: F401
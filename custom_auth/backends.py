@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+USER_CACHE_KEY = "custom_auth:user:{}"
+
+
+def _user_cache_ttl():
+    return getattr(settings, "USER_CACHE_TTL_SECONDS", 5)
+
+
+def invalidate_user(user_id):
+    cache.delete(USER_CACHE_KEY.format(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend whose get_user, which AuthenticationMiddleware calls on every
+    authenticated request, is served from the cache. Saving or deleting the
+    user drops the entry in the writing process; USER_CACHE_TTL_SECONDS bounds
+    how stale another process's copy (with a local-memory cache) can be.
+    """
+
+    def get_user(self, user_id):
+        key = USER_CACHE_KEY.format(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, _user_cache_ttl())
+            return user
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,97 @@
+import threading
+import time
+
+from django.conf import settings
+
+
+class VerificationCache:
+    """
+    Short-lived in-process cache of verify_lab_from_socket outcomes keyed on
+    (email, lab_id, verification_token).
+
+    Entries expire after ``ttl`` seconds and are dropped, per lab, when a
+    LabsActive or Collaboration row for that lab is saved or deleted in this
+    process and again when that transaction commits (see signals.py). Other worker processes see such a change
+    once their own entries expire, which is why the TTL is kept short.
+    """
+
+    def __init__(self, ttl=5.0, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = {}
+        self._keys_by_lab = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, email, lab_id, verification_token):
+        """Return the cached True/False outcome, or None if unknown or expired."""
+        key = (email, lab_id, verification_token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    self._discard(key)
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0]
+
+    def generation(self, lab_id):
+        """
+        Counter bumped on every invalidation of ``lab_id``. Read it before
+        querying and pass it to ``set`` so that an outcome computed before a
+        concurrent invalidation is not cached.
+        """
+        with self._lock:
+            return self._generations.get(lab_id, 0)
+
+    def set(self, email, lab_id, verification_token, verified, generation=None):
+        key = (email, lab_id, verification_token)
+        with self._lock:
+            if generation is not None and generation != self._generations.get(lab_id, 0):
+                return
+            self._discard(key)
+            # Dicts keep insertion order, so the first key is the oldest entry
+            while len(self._entries) >= self.max_size:
+                self._discard(next(iter(self._entries)))
+            self._entries[key] = (verified, time.monotonic() + self.ttl)
+            self._keys_by_lab.setdefault(lab_id, set()).add(key)
+
+    def _discard(self, key):
+        # Called with the lock held
+        if self._entries.pop(key, None) is not None:
+            keys = self._keys_by_lab.get(key[1])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_lab[key[1]]
+
+    def invalidate_lab(self, lab_id):
+        with self._lock:
+            for key in self._keys_by_lab.pop(lab_id, ()):
+                self._entries.pop(key, None)
+            self._generations[lab_id] = self._generations.get(lab_id, 0) + 1
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_lab.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
+
+
+verification_cache = VerificationCache(
+    ttl=getattr(settings, "VERIFICATION_CACHE_TTL_SECONDS", 5),
+    max_size=getattr(settings, "VERIFICATION_CACHE_MAX_SIZE", 10000),
+)
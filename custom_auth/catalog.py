@@ -0,0 +1,83 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import LabStation, LabsActive
+
+CATALOG_CACHE_KEY = "custom_auth:lab_catalog"
+ACTIVE_LABS_CACHE_KEY = "custom_auth:active_lab_owners"
+
+
+def _catalog_ttl():
+    return getattr(settings, "LAB_CATALOG_CACHE_TTL_SECONDS", 300)
+
+
+def _active_labs_ttl():
+    return getattr(settings, "ACTIVE_LABS_CACHE_TTL_SECONDS", 5)
+
+
+def lab_catalog():
+    """[(lab_id, name), ...] for every station, in display order."""
+    catalog = cache.get(CATALOG_CACHE_KEY)
+    if catalog is None:
+        catalog = list(LabStation.objects.values_list("lab_id", "name"))
+        cache.set(CATALOG_CACHE_KEY, catalog, _catalog_ttl())
+    return catalog
+
+
+def _running_labs():
+    return LabsActive.objects.running().values_list("lab_id", "started_by_id", "ends_at")
+
+
+def active_lab_owners():
+    """
+    {lab_id: (owner user id, ends_at)} for every lab that has not run out of
+    time, from a single query. Expired rows awaiting the sweeper are skipped.
+    """
+    owners = cache.get(ACTIVE_LABS_CACHE_KEY)
+    if owners is None:
+        owners = {lab_id: (owner_id, ends_at) for lab_id, owner_id, ends_at in _running_labs()}
+        cache.set(ACTIVE_LABS_CACHE_KEY, owners, _active_labs_ttl())
+    return owners
+
+
+async def alab_catalog():
+    catalog = await cache.aget(CATALOG_CACHE_KEY)
+    if catalog is None:
+        catalog = [row async for row in LabStation.objects.values_list("lab_id", "name")]
+        await cache.aset(CATALOG_CACHE_KEY, catalog, _catalog_ttl())
+    return catalog
+
+
+async def aactive_lab_owners():
+    owners = await cache.aget(ACTIVE_LABS_CACHE_KEY)
+    if owners is None:
+        owners = {lab_id: (owner_id, ends_at) async for lab_id, owner_id, ends_at in _running_labs()}
+        await cache.aset(ACTIVE_LABS_CACHE_KEY, owners, _active_labs_ttl())
+    return owners
+
+
+def invalidate_catalog():
+    cache.delete(CATALOG_CACHE_KEY)
+
+
+def invalidate_active_labs():
+    cache.delete(ACTIVE_LABS_CACHE_KEY)
+
+
+def labs_with_time(catalog, active_owners, user_id):
+    """
+    The get_all_labs payload: each station with its state for ``user_id``.
+    time_remaining is in whole seconds and is 0 for stations not in use.
+    """
+    now = timezone.now()
+    labs = []
+    for lab_id, name in catalog:
+        owner_id, ends_at = active_owners.get(lab_id, (None, now))
+        labs.append({
+            "lab_id": lab_id,
+            "name": name,
+            "time_remaining": max(int((ends_at - now).total_seconds()), 0),
+            "owned_by_user": owner_id is not None and owner_id == user_id,
+        })
+    return labs
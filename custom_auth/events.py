@@ -0,0 +1,73 @@
+import asyncio
+import json
+import threading
+
+from django.conf import settings
+
+
+class InviteHub:
+    """
+    In-process fan-out of invite events to the invite_events streams.
+
+    Streams subscribe from their event loop with the email they are signed in
+    as; signal handlers publish from any thread. Each subscriber has a bounded
+    queue, and events for a client that stopped reading are dropped, so a
+    slow client cannot hold memory. Only clients connected to the process that
+    made the change are notified; the stream's opening "pending" event lets a
+    reconnecting client catch up with anything it missed.
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = {}  # casefolded email -> {queue: loop}
+        self._lock = threading.Lock()
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self, email):
+        """Return a queue receiving ``email``'s events; call from the event loop that reads it."""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(email.casefold(), {})[queue] = asyncio.get_running_loop()
+        return queue
+
+    def unsubscribe(self, email, queue):
+        with self._lock:
+            queues = self._subscribers.get(email.casefold(), {})
+            queues.pop(queue, None)
+            if not queues:
+                self._subscribers.pop(email.casefold(), None)
+
+    def publish(self, email, event, **data):
+        with self._lock:
+            subscribers = list(self._subscribers.get(email.casefold(), {}).items())
+            self.published += 1
+        message = {"event": event, "data": data}
+        for queue, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._deliver, queue, message)
+            except RuntimeError:
+                # The stream's event loop is gone
+                self.unsubscribe(email, queue)
+
+    def _deliver(self, queue, message):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            with self._lock:
+                self.dropped += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "subscribers": sum(len(queues) for queues in self._subscribers.values()),
+                "published": self.published,
+                "dropped": self.dropped,
+            }
+
+
+invite_hub = InviteHub(queue_size=getattr(settings, "INVITE_EVENTS_QUEUE_SIZE", 100))
+
+
+def server_sent_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
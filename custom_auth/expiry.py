@@ -0,0 +1,41 @@
+import logging
+import time
+
+from django.db import transaction
+
+from .models import LabsActive, Collaboration
+
+logger = logging.getLogger(__name__)
+
+
+def sweep_expired_labs(batch_size=500):
+    """
+    Delete labs whose start_time + max_time has passed, together with their
+    collaborations, batch_size labs per transaction. Deleting through the
+    ORM sends the usual signals, so caches and signed tokens for those labs
+    are invalidated as well.
+
+    Returns the number of labs and collaborations removed and the sweep time.
+    """
+    started = time.perf_counter()
+    labs_deleted = collaborations_deleted = batches = 0
+    while True:
+        with transaction.atomic():
+            lab_ids = list(LabsActive.objects.expired().values_list("lab_id", flat=True)[:batch_size])
+            if not lab_ids:
+                break
+            collaborations_deleted += Collaboration.objects.filter(lab_id__in=lab_ids).delete()[0]
+            labs_deleted += LabsActive.objects.filter(lab_id__in=lab_ids).delete()[0]
+        batches += 1
+
+    result = {
+        "labs": labs_deleted,
+        "collaborations": collaborations_deleted,
+        "batches": batches,
+        "seconds": time.perf_counter() - started,
+    }
+    logger.info(
+        "Expired %(labs)d labs and %(collaborations)d collaborations in %(batches)d batches (%(seconds).3f s)",
+        result,
+    )
+    return result
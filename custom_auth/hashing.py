@@ -0,0 +1,19 @@
+"""
+Entry points of the roster import's password hashing processes.
+
+Spawned workers unpickle these functions by importing this module before
+Django is set up, so it must not import models or anything that does,
+custom_auth.roster included.
+"""
+
+
+def init_worker():
+    import django
+
+    django.setup()
+
+
+def hash_password(password):
+    from django.contrib.auth.hashers import make_password
+
+    return make_password(password)
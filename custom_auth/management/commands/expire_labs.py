@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from custom_auth.expiry import sweep_expired_labs
+
+
+class Command(BaseCommand):
+    help = "Delete labs that have run past their max_time, along with their collaborations."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Labs deleted per transaction.")
+        parser.add_argument(
+            "--interval", type=float, default=None,
+            help="Keep running, sweeping every INTERVAL seconds, instead of sweeping once.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            result = sweep_expired_labs(batch_size=options["batch_size"])
+            self.stdout.write(
+                f"Expired {result['labs']} labs and {result['collaborations']} collaborations "
+                f"in {result['batches']} batches ({result['seconds'] * 1000:.1f} ms)"
+            )
+            if options["interval"] is None:
+                break
+            time.sleep(options["interval"])
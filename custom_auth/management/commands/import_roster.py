@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from custom_auth.roster import import_roster, read_roster, roster_format
+
+
+class Command(BaseCommand):
+    help = (
+        "Create accounts for a class roster. The file is CSV with a header row or JSONL, "
+        "with the fields email, password, first_name and last_name (only email is required)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Roster file; .jsonl/.ndjson is read as JSONL, anything else as CSV.")
+        parser.add_argument("--format", choices=["csv", "jsonl"], help="Override the format guessed from the name.")
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Rows checked and inserted together.")
+        parser.add_argument(
+            "--workers", type=int, default=None,
+            help="Password hashing processes (default: one per CPU, 0 hashes in this process).",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        try:
+            with open(path, newline="", encoding="utf-8") as f:
+                rows = read_roster(f, options["format"] or roster_format(path))
+                result = import_roster(rows, chunk_size=options["chunk_size"], workers=options["workers"])
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not import {path}: {e}")
+
+        seconds = result["seconds"]
+        self.stdout.write(
+            f"Created {result['created']} of {result['rows']} users "
+            f"({result['existing']} already existed, {result['duplicates']} duplicates, {result['invalid']} invalid) "
+            f"in {seconds:.1f}s ({result['rows'] / seconds if seconds else 0:.0f} rows/s)"
+        )
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("custom_auth", "0002_alter_labsactive_lab_id"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="collaboration",
+            index=models.Index(fields=["collab_email", "accepted"], name="collab_email_accepted_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="collaboration",
+            index=models.Index(fields=["lab", "collab_email"], name="collab_lab_email_idx"),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:01
+
+from django.db import migrations, models
+
+# The stations get_all_labs used to hardcode
+INITIAL_STATIONS = [
+    ("photoeletriceffect1", "Photoelectric Effect 1"),
+    ("photoeletriceffect2", "Photoelectric Effect 2"),
+    ("atomicsepctroscopy1", "Atomic Spectroscopy 1"),
+    ("atomicsepctroscopy2", "Atomic Spectroscopy 2"),
+    ("frankhertz1", "Frank-Hertz 1"),
+    ("frankhertz2", "Frank-Hertz 2"),
+    ("diffractionandinterference1", "Diffraction and Interference 1"),
+    ("diffractionandinterference2", "Diffraction and Interference 2"),
+    ("gammaradiationabsorption1", "Gamma Radiation Absorption 1"),
+    ("gammaradiationabsorption2", "Gamma Radiation Absorption 2"),
+]
+
+
+def create_initial_stations(apps, schema_editor):
+    LabStation = apps.get_model("custom_auth", "LabStation")
+    LabStation.objects.bulk_create(
+        LabStation(lab_id=lab_id, name=name, position=position)
+        for position, (lab_id, name) in enumerate(INITIAL_STATIONS)
+    )
+
+
+def delete_initial_stations(apps, schema_editor):
+    LabStation = apps.get_model("custom_auth", "LabStation")
+    LabStation.objects.filter(lab_id__in=[lab_id for lab_id, _ in INITIAL_STATIONS]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("custom_auth", "0003_lab_lookup_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LabStation",
+            fields=[
+                ("lab_id", models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ("name", models.CharField(max_length=255)),
+                ("position", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "ordering": ["position", "lab_id"],
+            },
+        ),
+        migrations.RunPython(create_initial_stations, delete_initial_stations),
+    ]
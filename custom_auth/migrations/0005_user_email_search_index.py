@@ -0,0 +1,19 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:04
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("custom_auth", "0004_labstation"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="customuser",
+            index=models.Index(django.db.models.functions.text.Lower("email"), models.F("email"), name="customuser_email_lower_idx"),
+        ),
+    ]
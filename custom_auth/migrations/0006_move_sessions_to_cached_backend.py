@@ -0,0 +1,47 @@
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY
+from django.core.cache import caches
+from django.db import migrations
+from django.utils import timezone
+
+MODEL_BACKEND = "django.contrib.auth.backends.ModelBackend"
+CACHED_MODEL_BACKEND = "custom_auth.backends.CachedModelBackend"
+
+
+def switch_backend(old, new):
+    """
+    Rewrite the auth backend recorded in live sessions from ``old`` to ``new``;
+    a session whose backend is not in AUTHENTICATION_BACKENDS is logged out.
+    """
+    def migrate(apps, schema_editor):
+        Session = apps.get_model("sessions", "Session")
+        engine = import_module(settings.SESSION_ENGINE)
+        for session in Session.objects.filter(expire_date__gt=timezone.now()).iterator():
+            store = engine.SessionStore(session.session_key)
+            data = store.decode(session.session_data)
+            if data.get(BACKEND_SESSION_KEY) != old:
+                continue
+            data[BACKEND_SESSION_KEY] = new
+            session.session_data = store.encode(data)
+            session.save(update_fields=["session_data"])
+            # cached_db reads the cached copy first
+            if hasattr(store, "cache_key"):
+                caches[settings.SESSION_CACHE_ALIAS].delete(store.cache_key)
+    return migrate
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sessions", "0001_initial"),
+        ("custom_auth", "0005_user_email_search_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            switch_backend(MODEL_BACKEND, CACHED_MODEL_BACKEND),
+            switch_backend(CACHED_MODEL_BACKEND, MODEL_BACKEND),
+        ),
+    ]
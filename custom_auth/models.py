@@ -1,6 +1,7 @@
 from django.db import models
 from django.conf import settings  # To reference the custom user model dynamically
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
+from django.db.models.functions import Lower, Now
 import random
 import string
 
@@ -46,9 +47,44 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = "email"  # Use email as the unique identifier
     REQUIRED_FIELDS = []      # No additional required fields
 
+    class Meta:
+        indexes = [
+            # get_all_emails: case-insensitive prefix search, paged by (lower(email), email)
+            models.Index(Lower("email"), models.F("email"), name="customuser_email_lower_idx"),
+        ]
+
     def __str__(self):
         return self.email
 
+class LabStation(models.Model):
+    """
+    Catalog of lab stations that can be started, listed by get_all_labs.
+    """
+    lab_id = models.CharField(max_length=255, primary_key=True)  # Same ID used by LabsActive
+    name = models.CharField(max_length=255)  # Display name
+    position = models.PositiveIntegerField(default=0)  # Display order
+
+    class Meta:
+        ordering = ["position", "lab_id"]
+
+    def __str__(self):
+        return f"{self.name} (ID: {self.lab_id})"
+
+class LabsActiveQuerySet(models.QuerySet):
+    def with_ends_at(self):
+        """Annotate ends_at = start_time + max_time, computed by the database."""
+        return self.annotate(
+            ends_at=models.ExpressionWrapper(
+                models.F("start_time") + models.F("max_time"), output_field=models.DateTimeField()
+            )
+        )
+
+    def running(self):
+        return self.with_ends_at().filter(ends_at__gt=Now())
+
+    def expired(self):
+        return self.with_ends_at().filter(ends_at__lte=Now())
+
 class LabsActive(models.Model):
     """
     Table to store active labs with details.
@@ -65,6 +101,10 @@ class LabsActive(models.Model):
     )
     verification_token = models.CharField(max_length=12, unique=False, default='')  # Unique verification token
 
+    # Every lookup by lab_id is served by the primary key, so LabsActive needs
+    # no further indexes
+    objects = LabsActiveQuerySet.as_manager()
+
     def save(self, *args, **kwargs):
         if not self.verification_token:
             self.verification_token = ''.join(random.choices(string.ascii_letters + string.digits, k=12))
@@ -93,5 +133,13 @@ class Collaboration(models.Model):
     ])  # Permission level
     accepted = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # get_active_labs / get_all_collaborators_by_email: a user's (pending) invites
+            models.Index(fields=["collab_email", "accepted"], name="collab_email_accepted_idx"),
+            # accept_collab / rejoin_lab / verification: one user's row in one lab
+            models.Index(fields=["lab", "collab_email"], name="collab_lab_email_idx"),
+        ]
+
     def __str__(self):
         return f"Collaboration: {self.collab_email} on Lab ID {self.lab.lab_id} with {self.permission} permission"
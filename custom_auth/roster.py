@@ -0,0 +1,174 @@
+import csv
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+
+from .hashing import hash_password, init_worker
+from .models import CustomUser
+from .versions import DIRECTORY, bump
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ("email", "password", "first_name", "last_name")
+
+
+def _jsonl_rows(file):
+    for line, text in enumerate(file, start=1):
+        if text.strip():
+            try:
+                yield line, json.loads(text)
+            except ValueError as e:
+                raise ValueError(f"line {line}: {e}")
+
+
+def _field_value(value, field, line):
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        raise ValueError(f"line {line}: {field} must be a string, not {type(value).__name__}")
+    # JSONL may give numbers, e.g. a numeric password
+    return str(value).strip()
+
+
+def read_roster(file, format):
+    """
+    Yield one dict per student from an open text file, streaming. CSV needs a
+    header row naming the columns; JSONL has one JSON object per line. Only
+    ``email`` is required, a missing password leaves the account unusable
+    until it is reset. A JSONL line that is not an object yields a row without
+    an email, which the import counts as invalid; invalid JSON or a field
+    holding a list or object raises ValueError naming the line.
+    """
+    if format == "csv":
+        reader = csv.DictReader(file)
+        rows = ((reader.line_num, row) for row in reader)
+    elif format == "jsonl":
+        rows = _jsonl_rows(file)
+    else:
+        raise ValueError(f"Unknown roster format {format!r}, expected 'csv' or 'jsonl'")
+    for line, row in rows:
+        if not isinstance(row, dict):
+            row = {}
+        yield {field: _field_value(row.get(field), field, line) for field in FIELDS}
+
+
+def roster_format(filename):
+    return "jsonl" if filename.lower().endswith((".jsonl", ".ndjson")) else "csv"
+
+
+class PasswordHasher:
+    """
+    Hashes passwords in a pool of worker processes, which is where nearly all
+    of an import's time goes. With ``workers=0`` hashing runs inline.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = os.cpu_count() if workers is None else workers
+        self._pool = None
+        if self.workers:
+            # Spawned, like the inference workers: forking a process that
+            # holds database connections and threads is unsafe
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_worker,
+            )
+
+    def hash_all(self, passwords):
+        if self._pool is None:
+            return [make_password(password) for password in passwords]
+        chunksize = max(1, len(passwords) // (self.workers * 4))
+        return list(self._pool.map(hash_password, passwords, chunksize=chunksize))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def import_roster(rows, chunk_size=1000, workers=None):
+    """
+    Create a user for every roster row whose email is not taken yet.
+
+    Rows are handled ``chunk_size`` at a time: one query finds which of the
+    chunk's emails already exist, the new users' passwords are hashed in
+    parallel and the users are inserted with a single bulk_create. Returns
+    counts of created, existing, duplicate and invalid rows and the elapsed
+    seconds.
+    """
+    started = time.monotonic()
+    result = {"rows": 0, "created": 0, "existing": 0, "duplicates": 0, "invalid": 0}
+    seen = set()
+    rows = iter(rows)
+
+    with PasswordHasher(workers) as hasher:
+        while chunk := list(itertools.islice(rows, chunk_size)):
+            result["rows"] += len(chunk)
+
+            new_rows = []
+            for row in chunk:
+                email = CustomUser.objects.normalize_email(row["email"])
+                try:
+                    validate_email(email)
+                except ValidationError:
+                    result["invalid"] += 1
+                    continue
+                if email in seen:
+                    result["duplicates"] += 1
+                    continue
+                seen.add(email)
+                new_rows.append({**row, "email": email})
+
+            existing = set(
+                CustomUser.objects.filter(email__in=[row["email"] for row in new_rows]).values_list("email", flat=True)
+            )
+            result["existing"] += len(existing)
+            new_rows = [row for row in new_rows if row["email"] not in existing]
+
+            # Rows without a password get an unusable one, which needs no hashing
+            to_hash = [row["password"] for row in new_rows if row["password"]]
+            hashes = iter(hasher.hash_all(to_hash))
+            users = [
+                CustomUser(
+                    email=row["email"],
+                    password=next(hashes) if row["password"] else make_password(None),
+                    first_name=row["first_name"],
+                    last_name=row["last_name"],
+                )
+                for row in new_rows
+            ]
+            # A user created through the API since the existence query is
+            # skipped rather than failing the whole chunk. Passwords are
+            # salted, unusable ones included, so only the rows inserted here
+            # match both email and password
+            CustomUser.objects.bulk_create(users, ignore_conflicts=True)
+            inserted = set(
+                CustomUser.objects.filter(email__in=[user.email for user in users]).values_list("email", "password")
+            )
+            created = sum((user.email, user.password) in inserted for user in users)
+            result["created"] += created
+            result["existing"] += len(users) - created
+
+    # bulk_create sends no post_save for the directory version to follow
+    if result["created"]:
+        bump(DIRECTORY)
+    result["seconds"] = time.monotonic() - started
+    logger.info(
+        "Imported %d of %d roster rows (%d existing, %d duplicates, %d invalid) in %.1fs",
+        result["created"], result["rows"], result["existing"], result["duplicates"], result["invalid"],
+        result["seconds"],
+    )
+    return result
@@ -0,0 +1,130 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import Signal, receiver
+
+from .backends import invalidate_user
+from .cache import verification_cache
+from .catalog import invalidate_catalog, invalidate_active_labs
+from .events import invite_hub
+from .models import CustomUser, LabStation, LabsActive, Collaboration
+from .tokens import revocations
+from .versions import DIRECTORY, bump, shared_labs_scope
+
+# bulk_create sends no post_save; create_lab sends this with ``lab`` and the
+# created ``collaborations`` instead
+collaborations_bulk_created = Signal()
+
+
+def invalidate_now_and_on_commit(invalidate):
+    invalidate()
+    # Until the transaction commits, another request still reads the old rows
+    # and may cache them again (a verification under the new generation)
+    transaction.on_commit(invalidate)
+
+
+@receiver([post_save, post_delete], sender=LabsActive)
+def invalidate_lab_verification(sender, instance, **kwargs):
+    lab_id = instance.lab_id  # Deleting a lab clears its primary key before the commit
+    invalidate_now_and_on_commit(lambda: verification_cache.invalidate_lab(lab_id))
+
+
+@receiver([post_save, post_delete], sender=Collaboration)
+def invalidate_collaboration_verification(sender, instance, **kwargs):
+    lab_id = instance.lab_id
+    invalidate_now_and_on_commit(lambda: verification_cache.invalidate_lab(lab_id))
+
+
+@receiver(post_delete, sender=LabsActive)
+def revoke_lab_tokens(sender, instance, **kwargs):
+    revocations.revoke_lab(instance.lab_id)
+
+
+@receiver(post_delete, sender=Collaboration)
+def revoke_collaborator_tokens(sender, instance, **kwargs):
+    revocations.revoke_collaborator(instance.lab_id, instance.collab_email)
+
+
+@receiver([post_save, post_delete], sender=LabStation)
+def invalidate_lab_catalog(sender, **kwargs):
+    invalidate_now_and_on_commit(invalidate_catalog)
+
+
+@receiver([post_save, post_delete], sender=LabsActive)
+def invalidate_active_lab_owners(sender, **kwargs):
+    invalidate_now_and_on_commit(invalidate_active_labs)
+
+
+@receiver([post_save, post_delete], sender=CustomUser)
+def invalidate_cached_user(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+def shared_labs_scopes(collaborations):
+    return [shared_labs_scope(email) for email in collaborations.values_list("collab_email", flat=True)]
+
+
+@receiver([post_save, post_delete], sender=Collaboration)
+def bump_shared_labs_version(sender, instance, **kwargs):
+    bump(shared_labs_scope(instance.collab_email))
+
+
+@receiver(post_save, sender=LabsActive)
+def bump_lab_collaborators_versions(sender, instance, created, **kwargs):
+    # A new lab has no collaborators yet, and deleting a lab deletes its
+    # collaborations, which bump their own versions
+    if not created:
+        bump(*shared_labs_scopes(Collaboration.objects.filter(lab_id=instance.lab_id)))
+
+
+@receiver(post_save, sender=CustomUser)
+def bump_directory_version(sender, instance, created, update_fields, **kwargs):
+    # Logins save last_login only, which changes no listing
+    if update_fields is not None and "email" not in update_fields:
+        return
+    bump(DIRECTORY)
+    if not created:
+        # get_active_labs shows the owner's email to their collaborators
+        bump(*shared_labs_scopes(Collaboration.objects.filter(lab__started_by_id=instance.pk)))
+
+
+@receiver(post_delete, sender=CustomUser)
+def bump_directory_version_on_delete(sender, **kwargs):
+    bump(DIRECTORY)
+
+
+def publish_invite(collaboration, lab):
+    invite_hub.publish(
+        collaboration.collab_email, "invite",
+        lab_id=lab.lab_id, lab_name=lab.lab_name, permission=collaboration.permission,
+    )
+
+
+@receiver(post_init, sender=Collaboration)
+def remember_accepted(sender, instance, **kwargs):
+    # Read from __dict__ so that a deferred field is not loaded
+    instance._saved_accepted = instance.__dict__.get("accepted")
+
+
+@receiver(post_save, sender=Collaboration)
+def push_invite_events(sender, instance, created, **kwargs):
+    # Clients only hear about rows that were actually committed, and about an
+    # acceptance only when the row goes from pending to accepted
+    if created:
+        transaction.on_commit(lambda: publish_invite(instance, instance.lab))
+    elif instance.accepted and not instance._saved_accepted:
+        email, lab_id = instance.collab_email, instance.lab_id
+        transaction.on_commit(lambda: invite_hub.publish(email, "accepted", lab_id=lab_id))
+    instance._saved_accepted = instance.accepted
+
+
+@receiver(collaborations_bulk_created, sender=Collaboration)
+def bump_bulk_shared_labs_versions(sender, collaborations, **kwargs):
+    bump(*(shared_labs_scope(collaboration.collab_email) for collaboration in collaborations))
+
+
+@receiver(collaborations_bulk_created, sender=Collaboration)
+def push_bulk_invite_events(sender, lab, collaborations, **kwargs):
+    def publish():
+        for collaboration in collaborations:
+            publish_invite(collaboration, lab)
+    transaction.on_commit(publish)
@@ -1,3 +1,664 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import tempfile
+from datetime import timedelta
+from importlib import import_module
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from mysite import metrics
+from mysite.instrumentation import request_metrics
+
+from .cache import verification_cache
+from .catalog import ACTIVE_LABS_CACHE_KEY
+from .events import invite_hub
+from .models import CustomUser, LabStation, LabsActive, Collaboration
+from .roster import PasswordHasher
+from .views import invite_events
+
+
+class GetActiveLabsTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email="student@example.com")
+        self.client.force_login(self.user)
+        # Warm the session and user caches so every measured request is alike
+        self.client.get("/auth/get_active_labs/")
+
+    def share_labs(self, count):
+        start = LabsActive.objects.count()
+        for i in range(start, start + count):
+            owner = CustomUser.objects.create_user(email=f"owner{i}@example.com")
+            lab = LabsActive.objects.create(
+                lab_id=f"lab{i}", lab_name=f"Lab {i}", started_by=owner, max_time=timedelta(hours=1)
+            )
+            Collaboration.objects.create(lab=lab, collab_email=self.user.email, permission="write", accepted=True)
+
+    def get_active_labs(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/auth/get_active_labs/")
+        self.assertEqual(response.status_code, 200)
+        return response.json()["labs_shared"], len(queries)
+
+    def test_returns_owner_and_permission(self):
+        self.share_labs(1)
+        labs, _ = self.get_active_labs()
+        self.assertEqual(labs, [
+            {"owner_email": "owner0@example.com", "lab_id": "lab0", "lab_name": "Lab 0", "permission": "write"},
+        ])
+
+    def test_query_count_does_not_grow_with_labs(self):
+        self.share_labs(1)
+        labs, one_lab_queries = self.get_active_labs()
+        self.assertEqual(len(labs), 1)
+
+        self.share_labs(10)
+        labs, many_lab_queries = self.get_active_labs()
+        self.assertEqual(len(labs), 11)
+        self.assertEqual(one_lab_queries, many_lab_queries)
+
+
+class RequestMetricsTests(TestCase):
+    def test_records_view_time_and_queries(self):
+        request_metrics.reset()
+        user = CustomUser.objects.create_user(email="student@example.com")
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/auth/get_active_labs/")
+
+        metrics = request_metrics.snapshot()["get_active_labs"]
+        self.assertEqual(metrics["statuses"], {200: 1})
+        self.assertEqual(metrics["wall_seconds"]["count"], 1)
+        self.assertEqual(metrics["db_queries"]["sum"], len(queries))
+
+
+class MetricsEndpointTests(TestCase):
+    def setUp(self):
+        request_metrics.reset()
+        self.client.force_login(CustomUser.objects.create_user(email="student@example.com"))
+        self.client.get("/auth/get_active_labs/")
+
+    def test_prometheus_text_format(self):
+        body = self.client.get("/metrics/").content.decode()
+        self.assertIn("# TYPE django_http_request_duration_seconds histogram", body)
+        self.assertIn('django_http_requests_total{view="get_active_labs",status="200"} 1', body)
+        self.assertIn('django_http_request_duration_seconds_bucket{view="get_active_labs",le="+Inf"} 1', body)
+        self.assertIn("chat_prediction_cache_hits_total 0", body)
+
+    def test_adds_up_worker_processes(self):
+        directory = tempfile.mkdtemp()
+        # A worker that has exited: its counters count, its gauges do not
+        with open(os.path.join(directory, "999999999.json"), "w") as f:
+            f.write(json.dumps(metrics.collect()))
+        with self.settings(METRICS_DIR=directory):
+            body = self.client.get("/metrics/").content.decode()
+        self.assertIn('django_http_requests_total{view="get_active_labs",status="200"} 2', body)
+        self.assertIn("chat_batch_queue_depth 0", body)
+        self.assertTrue(os.path.exists(os.path.join(directory, f"{os.getpid()}.json")))
+
+
+class CachedAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(email="student@example.com")
+        self.client.force_login(self.user)
+
+    def test_warm_request_skips_session_and_user_queries(self):
+        self.client.get("/auth/get_all_labs/")
+        with self.assertNumQueries(0):
+            response = self.client.get("/auth/get_all_labs/")
+        self.assertEqual(response.status_code, 200)
+
+    def test_saving_the_user_drops_the_cached_copy(self):
+        self.client.get("/auth/get_all_labs/")
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get("/auth/get_all_labs/").status_code, 401)
+
+    def test_failed_login_hashes_once(self):
+        self.user.set_password("right password")
+        self.user.save()
+        for email in ("student@example.com", "nobody@example.com"):
+            with mock.patch.object(PBKDF2PasswordHasher, "verify", autospec=True, return_value=False) as verify, \
+                    mock.patch.object(PBKDF2PasswordHasher, "encode", autospec=True, return_value="x") as encode:
+                response = self.client.post(
+                    "/auth/login_user/", {"email": email, "password": "wrong"}, content_type="application/json"
+                )
+            self.assertEqual(response.status_code, 401)
+            self.assertEqual(verify.call_count + encode.call_count, 1)
+
+    def test_model_backend_sessions_are_moved_to_cached_backend(self):
+        migration = import_module("custom_auth.migrations.0006_move_sessions_to_cached_backend")
+        self.client.force_login(self.user, backend=migration.MODEL_BACKEND)
+        self.assertEqual(self.client.get("/auth/get_all_labs/").status_code, 401)
+
+        migration.switch_backend(migration.MODEL_BACKEND, migration.CACHED_MODEL_BACKEND)(apps, None)
+        self.assertEqual(self.client.get("/auth/get_all_labs/").status_code, 200)
+
+
+class VerifyLabFromSocketTests(TestCase):
+    def setUp(self):
+        verification_cache.clear()
+        self.owner = CustomUser.objects.create_user(email="owner@example.com")
+        self.lab = LabsActive.objects.create(
+            lab_id="frankhertz1", lab_name="Frank-Hertz 1", started_by=self.owner, max_time=timedelta(hours=1)
+        )
+        self.collaboration = Collaboration.objects.create(
+            lab=self.lab, collab_email="student@example.com", permission="write"
+        )
+        self.token = self.lab.verification_token
+
+    def verify(self, email):
+        return self.client.post(
+            "/auth/verify_lab_from_socket/",
+            {"email": email, "lab_id": "frankhertz1", "verification_token": self.token},
+            content_type="application/json",
+        ).status_code
+
+    def test_repeat_verification_is_served_from_cache(self):
+        self.assertEqual(self.verify(self.owner.email), 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.verify(self.owner.email), 200)
+
+    def test_accepting_collaboration_invalidates_cached_failure(self):
+        self.assertEqual(self.verify("student@example.com"), 404)
+        self.collaboration.accepted = True
+        self.collaboration.save()
+        self.assertEqual(self.verify("student@example.com"), 200)
+
+    def test_ending_lab_invalidates_cached_success(self):
+        self.assertEqual(self.verify(self.owner.email), 200)
+        self.lab.delete()
+        self.assertEqual(self.verify(self.owner.email), 404)
+
+    def test_outcome_cached_before_commit_is_dropped_on_commit(self):
+        self.assertEqual(self.verify(self.owner.email), 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lab.delete()
+            # A verification in another thread still sees the uncommitted
+            # lab and caches its outcome under the new generation
+            generation = verification_cache.generation("frankhertz1")
+            verification_cache.set(self.owner.email, "frankhertz1", self.token, True, generation)
+        self.assertEqual(self.verify(self.owner.email), 404)
+
+
+class VerifyLabsFromSocketTests(TestCase):
+    def setUp(self):
+        verification_cache.clear()
+
+    def test_query_count_does_not_grow_with_clients(self):
+        clients = []
+        for i in range(20):
+            owner = CustomUser.objects.create_user(email=f"owner{i}@example.com")
+            lab = LabsActive.objects.create(
+                lab_id=f"lab{i}", lab_name=f"Lab {i}", started_by=owner, max_time=timedelta(hours=1)
+            )
+            Collaboration.objects.create(lab=lab, collab_email=f"student{i}@example.com", permission="write", accepted=True)
+            clients += [
+                {"email": owner.email, "lab_id": lab.lab_id, "verification_token": lab.verification_token},
+                {"email": f"student{i}@example.com", "lab_id": lab.lab_id, "verification_token": lab.verification_token},
+                {"email": f"student{i}@example.com", "lab_id": lab.lab_id, "verification_token": "wrong"},
+            ]
+        clients.append({"email": "student0@example.com", "lab_id": "lab0"})
+        clients.append({"email": ["student0@example.com"], "lab_id": {"id": "lab0"}, "verification_token": "x"})
+        clients.append("student0@example.com")
+
+        with self.assertNumQueries(2):
+            response = self.client.post("/auth/verify_labs_from_socket/", clients, content_type="application/json")
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual([result["success"] for result in results], [True, True, False] * 20 + [False] * 3)
+        self.assertEqual(results[-2], {"success": False, "error": "Missing required fields"})
+
+
+class ApiLoginRequiredTests(TestCase):
+    def test_anonymous_callers_get_401_before_the_body_is_checked(self):
+        for path in ("/auth/rejoin_lab/", "/auth/start_lab/", "/auth/get_email_and_verification/"):
+            for body in ({}, "not json"):
+                response = self.client.post(path, body, content_type="application/json")
+                self.assertEqual(
+                    (response.status_code, response.json()), (401, {"error": "Authentication required"}), path
+                )
+        self.assertEqual(self.client.get("/auth/get_active_labs/").status_code, 401)
+
+
+class GetEmailAndVerificationTests(TestCase):
+    def setUp(self):
+        self.owner = CustomUser.objects.create_user(email="owner@example.com")
+        self.lab = LabsActive.objects.create(
+            lab_id="frankhertz1", lab_name="Frank-Hertz 1", started_by=self.owner, max_time=timedelta(hours=1)
+        )
+        self.client.force_login(self.owner)
+
+    def post(self, body):
+        return self.client.post("/auth/get_email_and_verification/", body, content_type="application/json")
+
+    def test_returns_token_of_owned_lab(self):
+        response = self.post({"lab_id": "frankhertz1"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["verification_token"], self.lab.verification_token)
+
+    def test_rejects_bodies_without_lab_id(self):
+        self.assertEqual(self.post(["frankhertz1"]).json(), {"error": "Expected a JSON object"})
+        for body in ({}, {"lab_id": 1}):
+            response = self.post(body)
+            self.assertEqual((response.status_code, response.json()), (400, {"error": "Lab ID is required"}))
+
+
+@override_settings(SIGNED_LAB_TOKENS=True)
+class SignedLabTokenTests(TestCase):
+    def setUp(self):
+        self.owner = CustomUser.objects.create_user(email="owner@example.com")
+        self.client.force_login(self.owner)
+        response = self.client.post(
+            "/auth/start_lab/",
+            {"lab_id": "frankhertz1", "lab_name": "Frank-Hertz 1", "time_restraint": 1},
+            content_type="application/json",
+        )
+        self.token = response.json()["lab_token"]
+
+    def verify(self, email="owner@example.com", token=None):
+        return self.client.post(
+            "/auth/verify_lab_from_socket/",
+            {"email": email, "lab_id": "frankhertz1", "verification_token": token or self.token},
+            content_type="application/json",
+        ).status_code
+
+    def test_signed_token_verifies_without_queries(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(self.verify(), 200)
+
+    def test_signed_token_is_bound_to_email(self):
+        self.assertEqual(self.verify(email="someone@example.com"), 404)
+
+    def test_tampered_token_is_rejected(self):
+        self.assertEqual(self.verify(token=self.token[:-1] + ("A" if self.token[-1] != "A" else "B")), 404)
+
+    def test_ending_lab_revokes_token(self):
+        LabsActive.objects.filter(lab_id="frankhertz1").delete()
+        self.assertEqual(self.verify(), 404)
+
+
+class GetAllLabsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(email="student@example.com")
+        self.client.force_login(self.user)
+
+    def get_all_labs(self):
+        response = self.client.get("/auth/get_all_labs/")
+        self.assertEqual(response.status_code, 200)
+        return {lab["lab_id"]: lab for lab in response.json()["labs"]}
+
+    def test_lists_catalog_from_database(self):
+        labs = self.get_all_labs()
+        self.assertEqual(len(labs), 10)
+        self.assertEqual(labs["frankhertz1"]["name"], "Frank-Hertz 1")
+
+        LabStation.objects.create(lab_id="millikan1", name="Millikan Oil Drop 1", position=10)
+        self.assertEqual(self.get_all_labs()["millikan1"]["name"], "Millikan Oil Drop 1")
+
+    def test_starting_lab_updates_cached_response(self):
+        self.assertEqual(self.get_all_labs()["frankhertz1"]["time_remaining"], 0)
+
+        LabsActive.objects.create(
+            lab_id="frankhertz1", lab_name="Frank-Hertz 1", started_by=self.user, max_time=timedelta(hours=1)
+        )
+        lab = self.get_all_labs()["frankhertz1"]
+        self.assertTrue(lab["owned_by_user"])
+        self.assertGreater(lab["time_remaining"], 0)
+
+    def test_owners_cached_before_commit_are_dropped_on_commit(self):
+        self.get_all_labs()
+        with self.captureOnCommitCallbacks(execute=True):
+            LabsActive.objects.create(
+                lab_id="frankhertz1", lab_name="Frank-Hertz 1", started_by=self.user, max_time=timedelta(hours=1)
+            )
+            # Another request refills the cache without the uncommitted lab
+            cache.set(ACTIVE_LABS_CACHE_KEY, {})
+        self.assertTrue(self.get_all_labs()["frankhertz1"]["owned_by_user"])
+
+
+class StartLabTests(TestCase):
+    def setUp(self):
+        self.owner = CustomUser.objects.create_user(email="owner@example.com")
+        self.client.force_login(self.owner)
+
+    def start_lab(self, lab_id="lab0", collaborators=(), time_restraint=1):
+        return self.client.post("/auth/start_lab/", {
+            "lab_id": lab_id,
+            "lab_name": "Lab 0",
+            "collaborators": list(collaborators),
+            "time_restraint": time_restraint,
+        }, content_type="application/json")
+
+    def test_collaborators_are_deduplicated_and_bulk_inserted(self):
+        emails = ["a@example.com", " A@example.com", "b@example.com", "owner@example.com", ""]
+        emails += [f"student{i}@example.com" for i in range(30)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.start_lab(collaborators=emails)
+        self.assertEqual(response.status_code, 200)
+        collaborators = list(Collaboration.objects.filter(lab_id="lab0").values_list("collab_email", flat=True))
+        self.assertEqual(len(collaborators), 32)
+        self.assertIn("a@example.com", collaborators)
+        self.assertNotIn("owner@example.com", collaborators)
+        inserts = [query for query in queries if query["sql"].startswith('INSERT INTO "custom_auth_collaboration"')]
+        self.assertEqual(len(inserts), 1)
+
+    def test_running_lab_conflicts(self):
+        self.assertEqual(self.start_lab().status_code, 200)
+        response = self.start_lab(collaborators=["a@example.com"])
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Collaboration.objects.exists())
+
+    def test_expired_lab_is_replaced(self):
+        self.start_lab(collaborators=["old@example.com"])
+        LabsActive.objects.update(start_time=timezone.now() - timedelta(hours=2))
+        response = self.start_lab(collaborators=["new@example.com"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(LabsActive.objects.get().verification_token, response.json()["verification_token"])
+        self.assertEqual(list(Collaboration.objects.values_list("collab_email", flat=True)), ["new@example.com"])
+
+    def test_invalid_time_restraint(self):
+        self.assertEqual(self.start_lab(time_restraint="2").status_code, 400)
+        self.assertFalse(LabsActive.objects.exists())
+
+
+class InviteEventsTests(TestCase):
+    def setUp(self):
+        self.owner = CustomUser.objects.create_user(email="owner@example.com")
+        self.invitee = CustomUser.objects.create_user(email="invitee@example.com")
+
+    def test_inviting_and_accepting_publish_to_invitee(self):
+        async def subscribe():
+            return invite_hub.subscribe("Invitee@example.com")
+
+        loop = asyncio.new_event_loop()
+        queue = loop.run_until_complete(subscribe())
+        self.addCleanup(loop.close)
+        self.addCleanup(invite_hub.unsubscribe, "invitee@example.com", queue)
+
+        self.client.force_login(self.owner)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/auth/start_lab/", {
+                "lab_id": "lab0", "lab_name": "Lab 0", "collaborators": ["invitee@example.com"], "time_restraint": 1,
+            }, content_type="application/json")
+        self.client.force_login(self.invitee)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/auth/accept_collaboration/", {"lab_id": "lab0"}, content_type="application/json")
+
+        events = [loop.run_until_complete(asyncio.wait_for(queue.get(), 1)) for _ in range(2)]
+        self.assertEqual(events, [
+            {"event": "invite", "data": {"lab_id": "lab0", "lab_name": "Lab 0", "permission": "write"}},
+            {"event": "accepted", "data": {"lab_id": "lab0"}},
+        ])
+
+        # Later saves of the accepted collaboration announce nothing
+        collaboration = Collaboration.objects.get(lab_id="lab0", collab_email="invitee@example.com")
+        with self.captureOnCommitCallbacks(execute=True):
+            collaboration.permission = "read"
+            collaboration.save()
+        loop.run_until_complete(asyncio.sleep(0))
+        self.assertTrue(queue.empty())
+
+    def test_accepting_outside_accept_collab_publishes_once(self):
+        # E.g. ticking "accepted" in the admin
+        async def subscribe():
+            return invite_hub.subscribe("invitee@example.com")
+
+        loop = asyncio.new_event_loop()
+        queue = loop.run_until_complete(subscribe())
+        self.addCleanup(loop.close)
+        self.addCleanup(invite_hub.unsubscribe, "invitee@example.com", queue)
+
+        lab = LabsActive.objects.create(
+            lab_id="lab0", lab_name="Lab 0", started_by=self.owner, max_time=timedelta(hours=1)
+        )
+        Collaboration.objects.create(lab=lab, collab_email="invitee@example.com", permission="write")
+
+        collaboration = Collaboration.objects.get(lab=lab)
+        with self.captureOnCommitCallbacks(execute=True):
+            collaboration.accepted = True
+            collaboration.save()
+            collaboration.save()
+        loop.run_until_complete(asyncio.sleep(0))
+        self.assertEqual(queue.get_nowait(), {"event": "accepted", "data": {"lab_id": "lab0"}})
+        self.assertTrue(queue.empty())
+
+    async def test_stream_sends_pending_invites_then_pushed_events(self):
+        lab = await LabsActive.objects.acreate(lab_id="lab0", lab_name="Lab 0", started_by=self.owner, max_time=timedelta(hours=1))
+        await Collaboration.objects.acreate(lab=lab, collab_email="invitee@example.com", permission="write")
+
+        async def auser():
+            return self.invitee
+
+        request = AsyncRequestFactory().get("/auth/invite_events/")
+        request.auser = auser
+        response = await invite_events(request)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = aiter(response)
+        self.assertEqual(await anext(stream), b'event: pending\ndata: {"lab_ids": ["lab0"]}\n\n')
+
+        invite_hub.publish("invitee@example.com", "accepted", lab_id="lab0")
+        self.assertEqual(await anext(stream), b'event: accepted\ndata: {"lab_id": "lab0"}\n\n')
+
+        # The ASGI handler cancels the response task when the client disconnects
+        waiting = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        self.assertEqual(invite_hub.stats()["subscribers"], 0)
+
+
+@override_settings(USER_DIRECTORY_PAGE_SIZE=2)
+class GetAllEmailsTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email="me@example.com")
+        for email in ["Ann@example.com", "andy@example.com", "anna@example.com", "bob@example.com"]:
+            CustomUser.objects.create_user(email=email)
+        self.client.force_login(self.user)
+
+    def get_emails(self, **params):
+        return self.client.get("/auth/get_all_emails/", params)
+
+    def test_prefix_search_is_paginated(self):
+        page = self.get_emails(q="AN").json()
+        self.assertEqual(page, {"emails": ["andy@example.com", "Ann@example.com"], "next": "Ann@example.com"})
+        page = self.get_emails(q="an", after=page["next"]).json()
+        self.assertEqual(page, {"emails": ["anna@example.com"], "next": None})
+
+    def test_excludes_caller_and_caps_limit(self):
+        with self.settings(USER_DIRECTORY_MAX_PAGE_SIZE=10):
+            emails = self.get_emails(limit=50).json()["emails"]
+        self.assertEqual(len(emails), 4)
+        self.assertNotIn("me@example.com", emails)
+        self.assertEqual(self.get_emails(limit=0).status_code, 400)
+
+    def test_etag(self):
+        response = self.get_emails(q="b")
+        response = self.client.get("/auth/get_all_emails/", {"q": "b"}, headers={"If-None-Match": response["ETag"]})
+        self.assertEqual(response.status_code, 304)
+
+
+class ConditionalListingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = CustomUser.objects.create_user(email="owner@example.com")
+        self.user = CustomUser.objects.create_user(email="student@example.com")
+        lab = LabsActive.objects.create(lab_id="lab0", lab_name="Lab 0", started_by=self.owner, max_time=timedelta(hours=1))
+        self.collaboration = Collaboration.objects.create(lab=lab, collab_email=self.user.email, permission="write")
+        self.client.force_login(self.user)
+
+    def poll(self, path, etag):
+        return self.client.get(path, headers={"If-None-Match": etag})
+
+    def test_unchanged_listing_is_answered_without_queries(self):
+        etag = self.client.get("/auth/get_active_labs/")["ETag"]
+        with self.assertNumQueries(0):
+            response = self.poll("/auth/get_active_labs/", etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_collaboration_write_changes_etag(self):
+        etag = self.client.get("/auth/get_active_labs/")["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.collaboration.accepted = True
+            self.collaboration.save()
+        response = self.poll("/auth/get_active_labs/", etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["labs_shared"][0]["lab_id"], "lab0")
+
+    def test_directory_changes_on_new_user_but_not_on_login(self):
+        etag = self.client.get("/auth/get_all_emails/")["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_login(self.owner)
+            self.client.force_login(self.user)
+        self.assertEqual(self.poll("/auth/get_all_emails/", etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            CustomUser.objects.create_user(email="new@example.com")
+        self.assertEqual(self.poll("/auth/get_all_emails/", etag).status_code, 200)
+
+    def test_large_bodies_are_compressed(self):
+        CustomUser.objects.bulk_create(CustomUser(email=f"user{i}@example.com") for i in range(50))
+        response = self.client.get("/auth/get_all_emails/", {"limit": 50}, headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertTrue(response["ETag"].startswith("W/"))
+        self.assertEqual(self.poll("/auth/get_all_emails/?limit=50", response["ETag"]).status_code, 304)
+
+        response = self.client.get("/auth/get_active_labs/", headers={"Accept-Encoding": "gzip"})
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+
+class ExpireLabsTests(TestCase):
+    def start_lab(self, lab_id, started_ago, max_time):
+        owner = CustomUser.objects.create_user(email=f"{lab_id}@example.com")
+        lab = LabsActive.objects.create(lab_id=lab_id, lab_name=lab_id, started_by=owner, max_time=max_time)
+        LabsActive.objects.filter(lab_id=lab_id).update(start_time=timezone.now() - started_ago)
+        Collaboration.objects.create(lab=lab, collab_email="student@example.com", permission="write")
+
+    def test_sweeps_only_expired_labs_and_their_collaborations(self):
+        self.start_lab("expired1", started_ago=timedelta(hours=2), max_time=timedelta(hours=1))
+        self.start_lab("expired2", started_ago=timedelta(minutes=61), max_time=timedelta(hours=1))
+        self.start_lab("running", started_ago=timedelta(minutes=10), max_time=timedelta(hours=1))
+
+        out = StringIO()
+        call_command("expire_labs", batch_size=1, stdout=out)
+
+        self.assertIn("Expired 2 labs and 2 collaborations in 2 batches", out.getvalue())
+        self.assertEqual(list(LabsActive.objects.values_list("lab_id", flat=True)), ["running"])
+        self.assertEqual(list(Collaboration.objects.values_list("lab_id", flat=True)), ["running"])
+
+    def test_remaining_time_is_computed_by_the_database(self):
+        self.start_lab("running", started_ago=timedelta(minutes=10), max_time=timedelta(hours=1))
+        ends_at = LabsActive.objects.with_ends_at().get(lab_id="running").ends_at
+        self.assertAlmostEqual((ends_at - timezone.now()).total_seconds(), 50 * 60, delta=5)
+        self.assertFalse(LabsActive.objects.expired().exists())
+
+
+class ImportRosterTests(TestCase):
+    def write_roster(self, suffix, text):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_command_skips_existing_duplicate_and_invalid_rows(self):
+        CustomUser.objects.create_user(email="taken@example.com")
+        path = self.write_roster(".csv", (
+            "email,password,first_name,last_name\n"
+            "new@example.com,s3cret-pass,Ada,Lovelace\n"
+            "taken@example.com,,,\n"
+            "new@EXAMPLE.com,,,\n"
+            "not-an-email,,,\n"
+            "other@example.com,,,\n"
+        ))
+        out = StringIO()
+        call_command("import_roster", path, workers=0, chunk_size=2, stdout=out)
+
+        self.assertIn("Created 2 of 5 users (1 already existed, 1 duplicates, 1 invalid)", out.getvalue())
+        user = CustomUser.objects.get(email="new@example.com")
+        self.assertEqual(user.first_name, "Ada")
+        self.assertTrue(user.check_password("s3cret-pass"))
+        self.assertFalse(CustomUser.objects.get(email="other@example.com").has_usable_password())
+
+    def test_jsonl_values_that_are_not_strings(self):
+        path = self.write_roster(".jsonl", (
+            '{"email": "a@example.com", "password": 12345678}\n'
+            '["b@example.com"]\n'
+            '"c@example.com"\n'
+        ))
+        out = StringIO()
+        call_command("import_roster", path, workers=0, stdout=out)
+
+        self.assertIn("Created 1 of 3 users (0 already existed, 0 duplicates, 2 invalid)", out.getvalue())
+        self.assertTrue(CustomUser.objects.get(email="a@example.com").check_password("12345678"))
+
+        for text, message in (
+            ('{"email": "d@example.com"}\n{"email": ["e@example.com"]}\n', "line 2: email must be a string, not list"),
+            ('{"email": "d@example.com"}\n\n{"email": \n', "line 3: "),
+        ):
+            path = self.write_roster(".jsonl", text)
+            with self.assertRaisesMessage(CommandError, message):
+                call_command("import_roster", path, workers=0, stdout=StringIO())
+
+    def test_admin_upload_reports_malformed_rows(self):
+        self.client.force_login(CustomUser.objects.create_superuser(email="admin@example.com"))
+        path = self.write_roster(".jsonl", '{"email": {"address": "a@example.com"}}\n')
+        with open(path) as roster:
+            response = self.client.post(
+                "/admin/custom_auth/customuser/import-roster/", {"roster": roster}, follow=True
+            )
+        self.assertContains(response, "line 1: email must be a string, not dict")
+
+    def test_users_created_during_the_import_count_as_existing(self):
+        hash_all = PasswordHasher.hash_all
+
+        def hash_all_after_signup(hasher, passwords):
+            # Another request signs b@example.com up after the existence query
+            CustomUser.objects.create_user(email="b@example.com")
+            return hash_all(hasher, passwords)
+
+        path = self.write_roster(".csv", "email,password,first_name,last_name\na@example.com,,,\nb@example.com,,,\n")
+        out = StringIO()
+        with mock.patch.object(PasswordHasher, "hash_all", hash_all_after_signup):
+            call_command("import_roster", path, workers=0, stdout=out)
+
+        self.assertIn("Created 1 of 2 users (1 already existed, 0 duplicates, 0 invalid)", out.getvalue())
+        self.assertEqual(CustomUser.objects.filter(email__in=["a@example.com", "b@example.com"]).count(), 2)
+
+    def test_passwords_are_hashed_in_worker_processes(self):
+        path = self.write_roster(".csv", (
+            "email,password,first_name,last_name\n"
+            "a@example.com,pass-a,,\n"
+            "b@example.com,pass-b,,\n"
+        ))
+        out = StringIO()
+        call_command("import_roster", path, workers=2, stdout=out)
+
+        self.assertIn("Created 2 of 2 users", out.getvalue())
+        self.assertTrue(CustomUser.objects.get(email="a@example.com").check_password("pass-a"))
+        self.assertTrue(CustomUser.objects.get(email="b@example.com").check_password("pass-b"))
+
+    def test_admin_upload(self):
+        admin_user = CustomUser.objects.create_superuser(email="admin@example.com")
+        self.client.force_login(admin_user)
+        self.assertContains(self.client.get("/admin/custom_auth/customuser/"), "import-roster/")
+        self.assertContains(self.client.get("/admin/custom_auth/customuser/import-roster/"), 'name="roster"')
+
+        path = self.write_roster(".jsonl", '{"email": "a@example.com"}\n{"email": "b@example.com"}\n')
+        with open(path) as roster:
+            response = self.client.post("/admin/custom_auth/customuser/import-roster/", {"roster": roster})
+        self.assertRedirects(response, "/admin/custom_auth/customuser/")
+        self.assertEqual(CustomUser.objects.filter(email__in=["a@example.com", "b@example.com"]).count(), 2)
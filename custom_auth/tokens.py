@@ -0,0 +1,93 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core import signing
+
+SALT = "custom_auth.lab_token"
+
+
+class LabTokenRevocations:
+    """
+    In-memory record of labs that ended and collaborations that were removed.
+
+    A signed token carries the time it was issued; it is rejected if its lab
+    (or its lab and email) was revoked at or after that time. Entries older
+    than the longest token lifetime can no longer match a live token and are
+    pruned. Each process only learns about revocations it performs itself, so
+    LAB_TOKEN_MAX_AGE_SECONDS bounds how long another worker may still accept
+    a revoked token.
+    """
+
+    def __init__(self, retention):
+        self.retention = retention
+        self._labs = {}
+        self._collaborators = {}
+        self._lock = threading.Lock()
+
+    def revoke_lab(self, lab_id):
+        with self._lock:
+            self._labs[lab_id] = time.time()
+            self._prune()
+
+    def revoke_collaborator(self, lab_id, email):
+        with self._lock:
+            self._collaborators[(lab_id, email)] = time.time()
+            self._prune()
+
+    def is_revoked(self, lab_id, email, issued_at):
+        with self._lock:
+            revoked_at = max(self._labs.get(lab_id, 0), self._collaborators.get((lab_id, email), 0))
+        return revoked_at >= issued_at
+
+    def _prune(self):
+        # Called with the lock held
+        cutoff = time.time() - self.retention
+        for revoked in (self._labs, self._collaborators):
+            for key in [key for key, revoked_at in revoked.items() if revoked_at < cutoff]:
+                del revoked[key]
+
+    def __len__(self):
+        return len(self._labs) + len(self._collaborators)
+
+
+revocations = LabTokenRevocations(retention=getattr(settings, "LAB_TOKEN_MAX_AGE_SECONDS", 12 * 60 * 60))
+
+
+def make_lab_token(lab_id, email, permission, lab_ends_at):
+    """
+    Sign lab_id, email and permission with the project's signing key. The
+    token expires when the lab does, or after LAB_TOKEN_MAX_AGE_SECONDS if
+    that is sooner.
+    """
+    now = time.time()
+    expires = min(lab_ends_at.timestamp(), now + getattr(settings, "LAB_TOKEN_MAX_AGE_SECONDS", 12 * 60 * 60))
+    return signing.dumps(
+        {"lab": lab_id, "email": email, "perm": permission, "iat": now, "exp": expires},
+        salt=SALT,
+        compress=True,
+    )
+
+
+def is_signed_lab_token(token):
+    # Random database tokens are alphanumeric; signed ones contain separators
+    return isinstance(token, str) and ":" in token
+
+
+def read_lab_token(token):
+    """Return the token's payload, or None if it is forged, expired or revoked."""
+    try:
+        payload = signing.loads(token, salt=SALT)
+    except signing.BadSignature:
+        return None
+    if payload["exp"] < time.time():
+        return None
+    if revocations.is_revoked(payload["lab"], payload["email"], payload["iat"]):
+        return None
+    return payload
+
+
+def lab_token_verifies(token, email, lab_id):
+    """Check a signed token against the claimed email and lab without a query."""
+    payload = read_lab_token(token)
+    return payload is not None and payload["lab"] == lab_id and payload["email"] == email
@@ -1,5 +1,15 @@
+from django.conf import settings
 from django.urls import path
-from .views import create_user, login_user, get_active_labs, get_all_labs, start_lab, rejoin_lab, get_all_emails, get_all_collaborators_by_email, accept_collab, get_email_and_verification, verify_lab_from_socket
+from .views import create_user, login_user, get_active_labs, get_all_labs, start_lab, rejoin_lab, get_all_emails, get_all_collaborators_by_email, accept_collab, get_email_and_verification, verify_lab_from_socket, verify_labs_from_socket
+from .views import get_active_labs_async, get_all_labs_async, rejoin_lab_async, verify_lab_from_socket_async, invite_events
+
+# Under ASGI the hot endpoints are served by their native async views
+if settings.ASYNC_VIEWS:
+    get_active_labs = get_active_labs_async
+    get_all_labs = get_all_labs_async
+    rejoin_lab = rejoin_lab_async
+    verify_lab_from_socket = verify_lab_from_socket_async
+
 urlpatterns = [
     path("create_user/", create_user, name="create_user"),  # Create user endpoint
     path("login_user/", login_user, name="login_user"),     # Login user endpoint
@@ -12,4 +22,10 @@ urlpatterns = [
     path("accept_collaboration/", accept_collab, name="accept_collaboration"),  # Accept collaboration endpoint
     path("get_email_and_verification/", get_email_and_verification, name="get_email_and_verification"), 
     path("verify_lab_from_socket/", verify_lab_from_socket, name="verify_lab_from_socket"),
+    path("verify_labs_from_socket/", verify_labs_from_socket, name="verify_labs_from_socket"),  # Bulk verification for socket server restarts
 ]
+
+# Each open event stream holds a connection; under WSGI it would hold a worker
+# thread too, so the endpoint is only served by the ASGI app
+if settings.ASYNC_VIEWS:
+    urlpatterns.append(path("invite_events/", invite_events, name="invite_events"))
@@ -0,0 +1,104 @@
+import hashlib
+import uuid
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http.response import HttpResponseBase
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+
+from mysite.api import ApiResponse
+
+VERSION_CACHE_KEY = "custom_auth:version:{}"
+
+# Scope of the user directory served by get_all_emails
+DIRECTORY = "directory"
+
+
+def shared_labs_scope(email):
+    """Scope of the labs shared with ``email``, served by get_active_labs."""
+    return f"shared_labs:{email.casefold()}"
+
+
+def _ttl():
+    return getattr(settings, "LISTING_VERSION_TTL_SECONDS", 5)
+
+
+def _new_stamp():
+    return uuid.uuid4().hex
+
+
+def version(scope):
+    """The current version stamp of ``scope``; a missing one is started afresh."""
+    return cache.get_or_set(VERSION_CACHE_KEY.format(scope), _new_stamp, _ttl())
+
+
+async def aversion(scope):
+    return await cache.aget_or_set(VERSION_CACHE_KEY.format(scope), _new_stamp, _ttl())
+
+
+def bump(*scopes):
+    """
+    Give ``scopes`` new version stamps once the current transaction commits.
+    Bumping earlier would let a request that reads the new stamp tag the
+    old rows with it.
+    """
+    if scopes:
+        transaction.on_commit(lambda: cache.set_many(
+            {VERSION_CACHE_KEY.format(scope): _new_stamp() for scope in scopes}, _ttl()
+        ))
+
+
+def _etag(request, user, stamps):
+    key = "\n".join([str(user.pk), request.get_full_path(), *stamps])
+    return quote_etag(hashlib.md5(key.encode()).hexdigest())
+
+
+def _not_modified(request, etag):
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        response["ETag"] = etag
+    return response
+
+
+def _tagged(result, etag):
+    response = result if isinstance(result, HttpResponseBase) else ApiResponse(result)
+    if response.status_code == 200:
+        response["ETag"] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def versioned(scopes):
+    """
+    Answer a GET whose If-None-Match holds the current ETag with 304 before
+    the view runs. The ETag covers the user, the path with its query string
+    and the version stamps of ``scopes(user)``, so every write that can
+    change the response must bump one of those scopes (see signals.py).
+    Apply it inside api_login_required.
+    """
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_wrapped_view(request, *args, **kwargs):
+                user = await request.auser()
+                etag = _etag(request, user, [await aversion(scope) for scope in scopes(user)])
+                response = _not_modified(request, etag)
+                if response is not None:
+                    return response
+                return _tagged(await view_func(request, *args, **kwargs), etag)
+            return async_wrapped_view
+
+        @wraps(view_func)
+        def wrapped_view(request, *args, **kwargs):
+            etag = _etag(request, request.user, [version(scope) for scope in scopes(request.user)])
+            response = _not_modified(request, etag)
+            if response is not None:
+                return response
+            return _tagged(view_func(request, *args, **kwargs), etag)
+        return wrapped_view
+
+    return decorator
@@ -1,479 +1,679 @@
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
 from django.contrib.auth import get_user_model, authenticate, login
-from django.http import JsonResponse
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
 from django.utils.decorators import method_decorator
-import json
+import asyncio
+import hashlib
+from mysite.api import ApiError, ApiResponse, Field, api_view, validate
 from .models import LabsActive, Collaboration, CustomUser
+from .cache import verification_cache
+from .catalog import lab_catalog, active_lab_owners, alab_catalog, aactive_lab_owners, labs_with_time
+from .events import invite_hub, server_sent_event
+from .signals import collaborations_bulk_created
+from .tokens import make_lab_token, is_signed_lab_token, lab_token_verifies
+from .versions import DIRECTORY, shared_labs_scope, versioned
 from functools import wraps
-from datetime import datetime, timedelta
+from datetime import timedelta
 
 # Dynamically get the custom user model
 User = get_user_model()
 
 def api_login_required(view_func):
+    if iscoroutinefunction(view_func):
+        # request.user would hit the database synchronously; use auser() instead
+        @wraps(view_func)
+        async def async_wrapped_view(request, *args, **kwargs):
+            user = await request.auser()
+            if not user.is_authenticated:
+                return ApiResponse({"error": "Authentication required"}, status=401)
+            return await view_func(request, *args, **kwargs)
+        return async_wrapped_view
+
     @wraps(view_func)
     def wrapped_view(request, *args, **kwargs):
         if not request.user.is_authenticated:
-            return JsonResponse({"error": "Authentication required"}, status=401)
+            return ApiResponse({"error": "Authentication required"}, status=401)
         return view_func(request, *args, **kwargs)
     return wrapped_view
 
 @csrf_exempt
+@api_view("POST", schema={
+    "email": Field(str, message="Email and password are required"),
+    "password": Field(str, message="Email and password are required"),
+})
 def create_user(request):
-    if request.method == "POST":
-        try:
-            # Parse JSON data
-            data = json.loads(request.body)
-            email = data.get("email")
-            password = data.get("password")
-
-            # Validate input
-            if not email or not password:
-                return JsonResponse({"error": "Email and password are required"}, status=400)
-
-            # Check if the user already exists
-            if User.objects.filter(email=email).exists():
-                return JsonResponse({"error": "User with this email already exists"}, status=400)
+    email = request.json["email"]
+    password = request.json["password"]
 
-            # Create the user using the custom user model
-            user = User.objects.create_user(email=email, password=password)
-            return JsonResponse({"message": f"User with email {user.email} created successfully"}, status=201)
-        except json.JSONDecodeError:
-            return JsonResponse({"error": "Invalid JSON"}, status=400)
-        except Exception as e:
-            return JsonResponse({"error": str(e)}, status=500)
+    # Check if the user already exists
+    if User.objects.filter(email=email).exists():
+        raise ApiError("User with this email already exists")
 
-    return JsonResponse({"error": "Invalid request method"}, status=405)
+    # Create the user using the custom user model
+    user = User.objects.create_user(email=email, password=password)
+    return ApiResponse({"message": f"User with email {user.email} created successfully"}, status=201)
 
 @csrf_exempt
+@api_view("POST", schema={
+    "email": Field(str, message="Email and password are required"),
+    "password": Field(str, message="Email and password are required"),
+})
 def login_user(request):
-    if request.method == "POST":
-        try:
-            # Parse JSON data from the request body
-            data = json.loads(request.body)
-            email = data.get("email")
-            password = data.get("password")
-
-            # Validate input
-            if not email or not password:
-                return JsonResponse({"error": "Email and password are required"}, status=400)
-
-            # Authenticate the user
-            user = authenticate(request, username=email, password=password)
-            if user is not None:
-                # Log the user in (create session)
-                login(request, user)
-                return JsonResponse({"message": "Login successful"}, status=200)
-            else:
-                return JsonResponse({"error": "Invalid email or password"}, status=401)
-        except json.JSONDecodeError:
-            return JsonResponse({"error": "Invalid JSON"}, status=400)
-        except Exception as e:
-            return JsonResponse({"error": str(e)}, status=500)
-
-    return JsonResponse({"error": "Invalid request method"}, status=405)
+    # Authenticate the user
+    user = authenticate(request, username=request.json["email"], password=request.json["password"])
+    if user is None:
+        raise ApiError("Invalid email or password", status=401)
+
+    # Log the user in (create session)
+    login(request, user)
+    return {"message": "Login successful"}
+
+def shared_labs(user_email):
+    """
+    Accepted collaborations of ``user_email`` as one query joining the lab and
+    its owner, selecting only the columns get_active_labs returns.
+    """
+    return Collaboration.objects.filter(collab_email=user_email, accepted=True).values(
+        "lab_id", "lab__lab_name", "lab__started_by__email", "permission"
+    )
+
+def shared_lab_details_from_row(row):
+    return {
+        "owner_email": row["lab__started_by__email"],  #subject to change for owner_email
+        "lab_id": row["lab_id"],
+        "lab_name": row["lab__lab_name"],
+        "permission": row["permission"],
+    }
+
+def shared_labs_version(user):
+    return [shared_labs_scope(user.email)]
+
+def with_content_etag(request, data):
+    """
+    ``data`` as a response tagged with the hash of its body, or 304 when the
+    client already has it. For listings built without queries, where a
+    version stamp would not save anything.
+    """
+    response = ApiResponse(data)
+    response["ETag"] = quote_etag(hashlib.md5(response.content).hexdigest())
+    patch_cache_control(response, private=True, no_cache=True)
+    return get_conditional_response(request, etag=response["ETag"], response=response)
 
 @csrf_exempt
 @api_login_required
+@api_view("GET")
+@versioned(shared_labs_version)
 def get_active_labs(request):
-    if request.method == "GET":
-        try:
-            # Print all received headers
-            print("Request Headers:")
-            for header, value in request.headers.items():
-                print(f"{header}: {value}")
+    # Get the logged-in user's email
+    user_email = request.user.email
+
+    # Query labs associated with the user
+    # labs = LabsActive.objects.filter(started_by__email=user_email)
+    # lab_details = [{"lab_id": lab.lab_id, "lab_name": lab.lab_name} for lab in labs]
 
-            # Get the logged-in user's email
-            user_email = request.user.email
-            print("Authenticated User Email:", user_email)
+    shared_lab_details = [shared_lab_details_from_row(row) for row in shared_labs(user_email)]
 
-            # Query labs associated with the user
-            # labs = LabsActive.objects.filter(started_by__email=user_email)
-            # lab_details = [{"lab_id": lab.lab_id, "lab_name": lab.lab_name} for lab in labs]
-            
-            labs_shared = Collaboration.objects.filter(collab_email=user_email, accepted=True)
-            shared_lab_details = [{"owner_email": lab.lab.started_by.email,"lab_id": lab.lab.lab_id, "lab_name": lab.lab.lab_name, "permission": lab.permission} for lab in labs_shared] #subject to change for owner_email
+    # Return the lab details
+    return {"labs_shared": shared_lab_details}
 
-            # Return the lab details
-            return JsonResponse({"labs_shared": shared_lab_details}, status=200)
-        except Exception as e:
-            return JsonResponse({"error": str(e)}, status=500)
+@csrf_exempt
+@api_login_required
+@api_view("GET")
+@versioned(shared_labs_version)
+async def get_active_labs_async(request):
+    user = await request.auser()
 
-    return JsonResponse({"error": "Invalid request method"}, status=405)
+    shared_lab_details = [shared_lab_details_from_row(row) async for row in shared_labs(user.email)]
+
+    return {"labs_shared": shared_lab_details}
 
 @csrf_exempt
 @api_login_required
+@api_view("GET")
 def get_all_labs(request):
-    if request.method == "GET":
-        try:
-            # Print all received headers
-            print("Request Headers:")
-            for header, value in request.headers.items():
-                print(f"{header}: {value}")
-
-            # Get the logged-in user's email
-            user_email = request.user.email
-            print("Authenticated User Email:", user_email)
-
-            # Define all labs
-            all_lab_IDs = [
-                "photoeletriceffect1", "photoeletriceffect2", "atomicsepctroscopy1", "atomicsepctroscopy2", 
-                "frankhertz1", "frankhertz2", "diffractionandinterference1", "diffractionandinterference2", 
-                "gammaradiationabsorption1", "gammaradiationabsorption2"
-            ]
-            all_lab_names = [
-                "Photoelectric Effect 1", "Photoelectric Effect 2", "Atomic Spectroscopy 1", "Atomic Spectroscopy 2", 
-                "Frank-Hertz 1", "Frank-Hertz 2", "Diffraction and Interference 1", "Diffraction and Interference 2", 
-                "Gamma Radiation Absorption 1", "Gamma Radiation Absorption 2"
-            ]
-            time_remaining = [0] * len(all_lab_IDs)
-
-            # Get active lab IDs
-            active_lab_ids = LabsActive.objects.values_list('lab_id', flat=True)
-            active_lab_ids_list = list(active_lab_ids)
-            print("active labs: ", active_lab_ids)
-            
-            labs_start_by_user = LabsActive.objects.filter(started_by__email=user_email).values_list('lab_id', flat=True)
-            labs_start_by_user_list = list(labs_start_by_user)
-
-            labs_owned = [False] * 10
-            # Update time_remaining logic
-
-            for i in range(len(all_lab_IDs)):
-                if all_lab_IDs[i] not in active_lab_ids_list:
-                    time_remaining[i] = 0  #TODO: Placeholder logic for time remaining
-                else:
-                    if all_lab_IDs[i] in labs_start_by_user_list:
-                        labs_owned[i] = True
-                    time_remaining[i] = 1000 #TODO: Get the remaining time of each lab
-                # if all_lab_IDs[i] == "frankhertz1":
-                #     time_remaining[i] = 0
-
-            labs_with_time = [
-                {"lab_id": all_lab_IDs[i], "name": all_lab_names[i], "time_remaining": time_remaining[i], "owned_by_user": labs_owned[i]}
-                for i in range(len(all_lab_names))
-            ]
+    # Station catalog and active lab owners both come from the cache
+    catalog = lab_catalog()
+    active_owners = active_lab_owners()
 
-            # Return the lab details
-            return JsonResponse({"labs": labs_with_time}, status=200)
-        except Exception as e:
-            return JsonResponse({"error": str(e)}, status=500)
-
-    return JsonResponse({"error": "Invalid request method"}, status=405)
+    # time_remaining changes every second while a station is in use, so the
+    # ETag is taken from the body rather than from a version stamp
+    return with_content_etag(request, {"labs": labs_with_time(catalog, active_owners, request.user.id)})
 
 @csrf_exempt
 @api_login_required
-def start_lab(request):
-    if request.method == "POST":
-        try:
-            # Parse JSON data
-            data = json.loads(request.body)
-            lab_id = data.get("lab_id")
-            lab_name = data.get("lab_name")
-            # allow_collab = data.get("allow_collab")
-            collaborators = data.get("collaborators") # List of collab emails 
-            time_restraint = data.get("time_restraint")
-
-            # Validate input
-            if not lab_id or not lab_name:
-                return JsonResponse({"error": "Lab ID and lab name are required", "success": False}, status=400)
-            
-            # Get the logged-in user's email
-            user_email = request.user.email
-            # Check if the lab is already active
-            if LabsActive.objects.filter(lab_id=lab_id).exists():
-                return JsonResponse({"error": "Lab is already active", "success": False}, status=400)
-
-            # Start the lab
-            start_time = datetime.now()
-
-            user = CustomUser.objects.get(email=user_email)  # Retrieve the user instance
+@api_view("GET")
+async def get_all_labs_async(request):
+    user = await request.auser()
+
+    catalog = await alab_catalog()
+    active_owners = await aactive_lab_owners()
+
+    return with_content_etag(request, {"labs": labs_with_time(catalog, active_owners, user.id)})
+
+class LabAlreadyActive(Exception):
+    pass
+
+def unique_collaborator_emails(collaborators, owner_email):
+    """
+    Strip the invited emails and drop blanks, the owner and duplicates
+    (compared case-insensitively), keeping the first spelling of each.
+    """
+    emails = {}
+    for email in collaborators or []:
+        if not isinstance(email, str) or not email.strip():
+            continue
+        email = email.strip()
+        key = email.casefold()
+        if key != owner_email.casefold():
+            emails.setdefault(key, email)
+    return list(emails.values())
+
+def create_lab(owner, lab_id, lab_name, max_time, collaborator_emails):
+    """
+    Create the lab and all of its collaboration rows atomically, with one
+    bulk INSERT for the collaborations. A lab that ran out of time but has
+    not been swept yet is replaced; one that is still running raises
+    LabAlreadyActive, as does losing a race to start the same lab.
+    """
+    try:
+        with transaction.atomic():
+            existing = LabsActive.objects.select_for_update().with_ends_at().filter(lab_id=lab_id).first()
+            if existing is not None:
+                if existing.ends_at > timezone.now():
+                    raise LabAlreadyActive(lab_id)
+                existing.delete()
+
             lab = LabsActive.objects.create(
                 lab_id=lab_id,
                 lab_name=lab_name,
-                started_by=user,
+                started_by=owner,
                 allow_collab=True,
-                start_time=start_time,
-                max_time=timedelta(hours=time_restraint),
+                max_time=max_time,
             )
-            
-            if collaborators:
-                for email in collaborators:
-                    # Optionally, validate email format
-                    Collaboration.objects.create(
-                        lab=lab,
-                        collab_email=email,
-                        permission='write',  # TODO: Default permission to write
-                        accepted=False,  # Default to not accepted until confirmed
-                    )
-
-            # Save the verification token in the user's session
-            request.session['lab_unique_id'] = lab.verification_token
-
-            return JsonResponse({
-                "message": f"Lab {lab.lab_name} started successfully",
-                "verification_token": lab.verification_token, 
-                "success": True, 
-            }, status=200)
-
-        except json.JSONDecodeError:
-            return JsonResponse({"error": "Invalid JSON", "success": False}, status=400)
-        except Exception as e:
-            return JsonResponse({"error": str(e), "success": False}, status=500)
-
-    return JsonResponse({"error": "Invalid request method", "success": False}, status=405)
+            collaborations = Collaboration.objects.bulk_create([
+                Collaboration(
+                    lab=lab,
+                    collab_email=email,
+                    permission='write',  # TODO: Default permission to write
+                    accepted=False,  # Default to not accepted until confirmed
+                )
+                for email in collaborator_emails
+            ])
+            collaborations_bulk_created.send(sender=Collaboration, lab=lab, collaborations=collaborations)
+    except IntegrityError:
+        raise LabAlreadyActive(lab_id)
+    return lab
+
+def parse_page_size(value):
+    """The requested get_all_emails page size, defaulting to and capped by settings."""
+    if value is None:
+        return getattr(settings, "USER_DIRECTORY_PAGE_SIZE", 20)
+    limit = int(value)
+    if limit < 1:
+        raise ValueError("limit must be a positive integer")
+    return min(limit, getattr(settings, "USER_DIRECTORY_MAX_PAGE_SIZE", 100))
+
+def email_directory_page(prefix, after, limit, exclude=None):
+    """
+    Up to ``limit + 1`` emails starting with ``prefix`` (case-insensitively)
+    that sort after ``after``; the extra row tells the caller another page
+    exists. The prefix is matched as a range on lower(email) rather than with
+    LIKE so that every backend can use the expression index.
+    """
+    users = CustomUser.objects.annotate(email_lower=Lower("email"))
+    prefix = prefix.strip().lower()
+    if prefix:
+        users = users.filter(email_lower__gte=prefix, email_lower__lt=prefix[:-1] + chr(ord(prefix[-1]) + 1))
+    if after:
+        users = users.filter(
+            Q(email_lower__gt=after.lower()) | Q(email_lower=after.lower(), email__gt=after)
+        )
+    if exclude:
+        users = users.exclude(email=exclude)
+    return list(users.order_by("email_lower", "email").values_list("email", flat=True)[:limit + 1])
+
+def lab_token_fields(lab, email, permission):
+    # Signed tokens are opt-in; clients that do not know them keep using
+    # verification_token
+    if not getattr(settings, "SIGNED_LAB_TOKENS", False):
+        return {}
+    return {"lab_token": make_lab_token(lab.lab_id, email, permission, lab.start_time + lab.max_time)}
 
 @csrf_exempt
 @api_login_required
-def invite_person(request):
-    if request.method == "POST":
-        try:
-            # Parse the request data
-            data = json.loads(request.body)
-            lab_id = data.get("lab_id")
-            collab_email = data.get("collab_email")
-            if collab_email == request.user.email:
-                return JsonResponse({"error": "You can't invite yourself!"}, status=403)
-            permission = data.get("permission", "read")  # Default permission to 'read'
-
-            # Validate required fields
-            if not lab_id or not collab_email:
-                return JsonResponse({"error": "Lab ID and collaborator email are required."}, status=400)
-
-            # Check if the logged-in user started the lab
-            lab = LabsActive.objects.filter(lab_id=lab_id, started_by=request.user).first()
-            if not lab:
-                return JsonResponse({"error": "You are not the owner of this lab."}, status=403)
-
-            # Add collaboration
-            
-            Collaboration.objects.create(
-                lab=lab,
-                collab_email=collab_email,
-                permission=permission,
-                accepted=False  # Default to not accepted
-            )
-
-            return JsonResponse({"success": f"{collab_email} invited to lab {lab.lab_name}."}, status=200)
-
-        except Exception as e:
-            return JsonResponse({"error": str(e)}, status=500)
+@api_view("POST", success_flag=True, schema={
+    "lab_id": Field(str, message="Lab ID and lab name are required"),
+    "lab_name": Field(str, message="Lab ID and lab name are required"),
+    "collaborators": Field(list, required=False),  # List of collab emails
+    "time_restraint": Field(int, float, check=lambda hours: hours > 0,
+                            message="time_restraint must be a positive number of hours"),
+})
+def start_lab(request):
+    data = request.json
+    # allow_collab = data.get("allow_collab")
+
+    # Get the logged-in user's email
+    user_email = request.user.email
+    collaborator_emails = unique_collaborator_emails(data.get("collaborators"), user_email)
+
+    # Start the lab and invite everyone in one transaction
+    try:
+        lab = create_lab(
+            request.user, data["lab_id"], data["lab_name"], timedelta(hours=data["time_restraint"]), collaborator_emails
+        )
+    except LabAlreadyActive:
+        raise ApiError("Lab is already active", status=409)
+
+    # Save the verification token in the user's session
+    request.session['lab_unique_id'] = lab.verification_token
+
+    return {
+        "message": f"Lab {lab.lab_name} started successfully",
+        "verification_token": lab.verification_token,
+        **lab_token_fields(lab, user_email, "owner"),
+        "success": True,
+    }
 
-    return JsonResponse({"error": "Invalid request method."}, status=405)
+@csrf_exempt
+@api_login_required
+@api_view("POST", schema={
+    "lab_id": Field(str, message="Lab ID and collaborator email are required."),
+    "collab_email": Field(str, message="Lab ID and collaborator email are required."),
+})
+def invite_person(request):
+    lab_id = request.json["lab_id"]
+    collab_email = request.json["collab_email"]
+    if collab_email == request.user.email:
+        raise ApiError("You can't invite yourself!", status=403)
+    permission = request.json.get("permission", "read")  # Default permission to 'read'
+
+    # Check if the logged-in user started the lab
+    lab = LabsActive.objects.filter(lab_id=lab_id, started_by=request.user).first()
+    if not lab:
+        raise ApiError("You are not the owner of this lab.", status=403)
+
+    # Add collaboration
+    Collaboration.objects.create(
+        lab=lab,
+        collab_email=collab_email,
+        permission=permission,
+        accepted=False  # Default to not accepted
+    )
+
+    return {"success": f"{collab_email} invited to lab {lab.lab_name}."}
 
 @csrf_exempt
 @api_login_required
+@api_view("POST", schema={"lab_id": Field(str, message="Lab ID is required.")})
 def accept_collab(request):
-    if request.method == "POST":
-        try:
-            # Parse the request data
-            data = json.loads(request.body)
-            lab_id = data.get("lab_id")
-            user_email = request.user.email  # Get the logged-in user's email
+    lab_id = request.json["lab_id"]
+    user_email = request.user.email  # Get the logged-in user's email
 
-            # Validate required fields
-            if not lab_id:
-                return JsonResponse({"error": "Lab ID is required."}, status=400)
+    # Check if the collaboration exists
+    collaboration = Collaboration.objects.filter(
+        lab__lab_id=lab_id,
+        collab_email=user_email
+    ).first()
 
-            # Check if the collaboration exists
-            collaboration = Collaboration.objects.filter(
-                lab__lab_id=lab_id,
-                collab_email=user_email
-            ).first()
+    if not collaboration:
+        raise ApiError("No collaboration found for this lab and user.", status=404)
 
-            if not collaboration:
-                return JsonResponse({"error": "No collaboration found for this lab and user."}, status=404)
+    # Update the collaboration to accepted
+    if (collaboration.accepted == True):
+        raise ApiError("Invite Expired", status=404)
 
-            # Update the collaboration to accepted
-            if (collaboration.accepted == True):
-                return JsonResponse({"error": "Invite Expired"}, status=404)
+    collaboration.accepted = True
+    collaboration.save()
 
-            collaboration.accepted = True
-            collaboration.save()
-
-            return JsonResponse({"success": f"Collaboration for lab {lab_id} accepted by {user_email}."}, status=200)
-
-        except Exception as e:
-            return JsonResponse({"error": str(e)}, status=500)
-
-    return JsonResponse({"error": "Invalid request method."}, status=405)
+    return {"success": f"Collaboration for lab {lab_id} accepted by {user_email}."}
 
 @csrf_exempt
 @api_login_required
+@api_view("POST", success_flag=True, schema={"lab_id": Field(str, message="Lab ID is required")})
 def rejoin_lab(request):
-    if request.method == "POST":
-        try:
-            # Parse JSON data
-            data = json.loads(request.body)
-            lab_id = data.get("lab_id")
+    lab_id = request.json["lab_id"]
 
-            # Validate input
-            if not lab_id:
-                return JsonResponse({"error": "Lab ID is required", "success": False}, status=400)
+    # Get the logged-in user's email
+    user_email = request.user.email
 
-            # Get the logged-in user's email
-            user_email = request.user.email
+    # Check for owned lab
+    lab = LabsActive.objects.filter(started_by__email=user_email, lab_id=lab_id).first()
+    permission = "owner"
 
-            # Check for owned lab
-            lab = LabsActive.objects.filter(started_by__email=user_email, lab_id=lab_id).first()
+    # If not found in owned labs, check in shared labs
+    if not lab:
+        collaboration = Collaboration.objects.filter(collab_email=user_email, lab__lab_id=lab_id, accepted=True).first()
+        if collaboration:
+            lab = collaboration.lab  # Access the related lab
+            permission = collaboration.permission
 
-            # If not found in owned labs, check in shared labs
-            if not lab:
-                collaboration = Collaboration.objects.filter(collab_email=user_email, lab__lab_id=lab_id, accepted=True).first()
-                if collaboration:
-                    lab = collaboration.lab  # Access the related lab
+    # If no lab is found in either owned or shared
+    if not lab:
+        raise ApiError("No access or lab not found", status=404)
 
-            # If no lab is found in either owned or shared
-            if not lab:
-                return JsonResponse({"error": "No access or lab not found", "success": False}, status=404)
+    # Save the verification token in the user's session
+    request.session['lab_unique_id'] = lab.verification_token
 
-            # Save the verification token in the user's session
-            request.session['lab_unique_id'] = lab.verification_token
+    return {
+        "message": f"Lab '{lab.lab_name}' rejoined successfully",
+        "verification_token": lab.verification_token,
+        **lab_token_fields(lab, user_email, permission),
+        "success": True,
+    }
 
-            return JsonResponse({
-                "message": f"Lab '{lab.lab_name}' rejoined successfully",
-                "verification_token": lab.verification_token,
-                "success": True,
-            }, status=200)
-
-        except json.JSONDecodeError:
-            return JsonResponse({"error": "Invalid JSON", "success": False}, status=400)
-        except Exception as e:
-            return JsonResponse({"error": str(e), "success": False}, status=500)
-
-    return JsonResponse({"error": "Invalid request method", "success": False}, status=405)
+@csrf_exempt
+@api_login_required
+@api_view("POST", success_flag=True, schema={"lab_id": Field(str, message="Lab ID is required")})
+async def rejoin_lab_async(request):
+    lab_id = request.json["lab_id"]
+    user = await request.auser()
+
+    # Check for owned lab
+    lab = await LabsActive.objects.filter(started_by=user, lab_id=lab_id).afirst()
+    permission = "owner"
+
+    # If not found in owned labs, check in shared labs
+    if not lab:
+        collaboration = await Collaboration.objects.filter(
+            collab_email=user.email, lab__lab_id=lab_id, accepted=True
+        ).select_related("lab").afirst()
+        if collaboration:
+            lab = collaboration.lab
+            permission = collaboration.permission
+
+    # If no lab is found in either owned or shared
+    if not lab:
+        raise ApiError("No access or lab not found", status=404)
+
+    # Save the verification token in the user's session
+    await request.session.aset('lab_unique_id', lab.verification_token)
+
+    return {
+        "message": f"Lab '{lab.lab_name}' rejoined successfully",
+        "verification_token": lab.verification_token,
+        **lab_token_fields(lab, user.email, permission),
+        "success": True,
+    }
 
 @csrf_exempt
 @api_login_required
+@api_view("GET")
+@versioned(lambda user: [DIRECTORY])
 def get_all_emails(request):
-    if request.method == "GET":
-        try:
-            # Get all user emails
-            emails = CustomUser.objects.exclude(email=request.user.email).values_list('email', flat=True)
-            email_list = list(emails)
-
-            return JsonResponse({"emails": email_list}, status=200)
-        except Exception as e:
-            return JsonResponse({"error": str(e)}, status=500)
-
-    return JsonResponse({"error": "Invalid request method"}, status=405)
+    """
+    One page of the user directory for the invite autocomplete.
+
+    Query parameters: ``q`` (case-insensitive email prefix), ``after`` (the
+    ``next`` value of the previous page) and ``limit``. Pages are ordered by
+    lower-cased email and read from customuser_email_lower_idx. Repeated
+    polls are answered with 304 until a user is added, removed or renamed.
+    """
+    try:
+        limit = parse_page_size(request.GET.get("limit"))
+    except ValueError as e:
+        raise ApiError(str(e))
+
+    emails = email_directory_page(
+        request.GET.get("q", ""), request.GET.get("after"), limit, exclude=request.user.email
+    )
+    next_after = None
+    if len(emails) > limit:
+        emails = emails[:limit]
+        next_after = emails[-1]
+
+    return {"emails": emails, "next": next_after}
 
 @csrf_exempt
 @api_login_required
+@api_view("GET")
 def get_all_collaborators_by_email(request):
-    if request.method == "GET":
-        try:
-            # Get the logged-in user's email
-            user_email = request.user.email
+    # Get the logged-in user's email
+    user_email = request.user.email
 
-            # Get all lab IDs for collaborations associated with the user
-            lab_ids = list(
-                Collaboration.objects.filter(collab_email=user_email, accepted=False).values_list("lab__lab_id", flat=True)
-            )
-            
-            if not lab_ids:
-                return JsonResponse({"message": "No pending collaborations found."}, status=200)
+    # Get all lab IDs for collaborations associated with the user
+    lab_ids = list(
+        Collaboration.objects.filter(collab_email=user_email, accepted=False).values_list("lab__lab_id", flat=True)
+    )
 
-            return JsonResponse({"lab_ids": lab_ids}, status=200)
-        except Exception as e:
-            return JsonResponse({"error": str(e)}, status=500)
+    if not lab_ids:
+        return {"message": "No pending collaborations found."}
 
-    return JsonResponse({"error": "Invalid request method"}, status=405)
+    return {"lab_ids": lab_ids}
+
+@csrf_exempt
+@api_login_required
+@api_view("GET")
+async def invite_events(request):
+    """
+    Server-sent events replacing polling of get_all_collaborators_by_email.
+
+    The stream opens with a "pending" event listing the lab IDs the user is
+    invited to, then sends "invite" (lab_id, lab_name, permission) when a lab
+    invites them and "accepted" (lab_id) when they accept one. Comment lines
+    are sent when nothing happens for INVITE_EVENTS_KEEPALIVE_SECONDS so that
+    proxies keep the connection open.
+    """
+    user = await request.auser()
+    keepalive = getattr(settings, "INVITE_EVENTS_KEEPALIVE_SECONDS", 15)
+
+    async def stream():
+        # Subscribe before reading the pending invites so none fall between
+        queue = invite_hub.subscribe(user.email)
+        try:
+            lab_ids = [
+                lab_id async for lab_id in Collaboration.objects.filter(
+                    collab_email=user.email, accepted=False
+                ).values_list("lab_id", flat=True)
+            ]
+            yield server_sent_event("pending", {"lab_ids": lab_ids})
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield server_sent_event(message["event"], message["data"])
+        finally:
+            invite_hub.unsubscribe(user.email, queue)
+
+    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # nginx would otherwise buffer the stream
+    return response
 
-from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from .models import LabsActive, Collaboration
 
+# One socket client's credentials, for the single and the bulk endpoint
+LAB_ACCESS_SCHEMA = {
+    "email": Field(str, message="Missing required fields"),
+    "verification_token": Field(str, message="Missing required fields"),
+    "lab_id": Field(str, message="Missing required fields"),
+}
+
+def lab_access_queries(email, lab_id, verification_token):
+    # The lab is either owned by email or shared with it and accepted
+    owned = LabsActive.objects.filter(
+        started_by__email=email,
+        lab_id=lab_id,
+        verification_token=verification_token
+    )
+    shared = Collaboration.objects.filter(
+        collab_email=email,
+        lab__lab_id=lab_id,
+        lab__verification_token=verification_token,
+        accepted=True
+    )
+    return owned, shared
+
+def lab_access_verified(email, lab_id, verification_token):
+    """
+    Whether email may join lab_id with verification_token. Outcomes are kept
+    in the verification cache so reconnect storms do not reach the database.
+    """
+    # Signed tokens carry everything needed to check them without a query
+    if is_signed_lab_token(verification_token):
+        return lab_token_verifies(verification_token, email, lab_id)
+
+    verified = verification_cache.get(email, lab_id, verification_token)
+    if verified is None:
+        generation = verification_cache.generation(lab_id)
+        owned, shared = lab_access_queries(email, lab_id, verification_token)
+        verified = owned.exists() or shared.exists()
+        verification_cache.set(email, lab_id, verification_token, verified, generation)
+    return verified
+
+async def alab_access_verified(email, lab_id, verification_token):
+    if is_signed_lab_token(verification_token):
+        return lab_token_verifies(verification_token, email, lab_id)
+
+    verified = verification_cache.get(email, lab_id, verification_token)
+    if verified is None:
+        generation = verification_cache.generation(lab_id)
+        owned, shared = lab_access_queries(email, lab_id, verification_token)
+        verified = await owned.aexists() or await shared.aexists()
+        verification_cache.set(email, lab_id, verification_token, verified, generation)
+    return verified
+
 @csrf_exempt
+@api_view("POST", success_flag=True, schema=LAB_ACCESS_SCHEMA)
 def verify_lab_from_socket(request):
-    if request.method == "POST":
-        try:
-            # Parse request body
-            data = json.loads(request.body)
-            email = data.get("email")
-            verification_token = data.get("verification_token")
-            lab_id = data.get("lab_id")
-
-            # Validate required fields
-            if not (email and verification_token and lab_id):
-                return JsonResponse({"success": False, "error": "Missing required fields"}, status=400)
-
-            # Check if the lab exists under LabsActive
-            lab = LabsActive.objects.filter(
-                started_by__email=email,
-                lab_id=lab_id,
-                verification_token=verification_token
-            ).first()
+    data = request.json
+    if lab_access_verified(data["email"], data["lab_id"], data["verification_token"]):
+        return {"success": True}
+
+    # If neither exists, return failure
+    raise ApiError("Lab not found or verification failed", status=404)
+
+def lab_access_verified_bulk(triples):
+    """
+    lab_access_verified for many (email, lab_id, verification_token) triples.
+    Cache misses are resolved together with one LabsActive and one
+    Collaboration query, however many triples there are.
+    """
+    results = [
+        lab_token_verifies(triple[2], triple[0], triple[1]) if is_signed_lab_token(triple[2])
+        else verification_cache.get(*triple)
+        for triple in triples
+    ]
+    missing = [i for i, verified in enumerate(results) if verified is None]
+    if not missing:
+        return results
+
+    lab_ids = {triples[i][1] for i in missing}
+    emails = {triples[i][0] for i in missing}
+    generations = {lab_id: verification_cache.generation(lab_id) for lab_id in lab_ids}
+
+    # lab_id -> (verification_token, owner email)
+    labs = {
+        lab_id: (token, owner_email)
+        for lab_id, token, owner_email in LabsActive.objects.filter(lab_id__in=lab_ids).values_list(
+            "lab_id", "verification_token", "started_by__email"
+        )
+    }
+    accepted = set(
+        Collaboration.objects.filter(lab_id__in=lab_ids, collab_email__in=emails, accepted=True).values_list(
+            "collab_email", "lab_id"
+        )
+    )
+
+    for i in missing:
+        email, lab_id, verification_token = triples[i]
+        lab = labs.get(lab_id)
+        verified = lab is not None and lab[0] == verification_token and (
+            lab[1] == email or (email, lab_id) in accepted
+        )
+        verification_cache.set(email, lab_id, verification_token, verified, generations[lab_id])
+        results[i] = verified
+    return results
 
-            if lab:
-                return JsonResponse({"success": True}, status=200)
+@csrf_exempt
+@api_view("POST", success_flag=True)
+def verify_labs_from_socket(request):
+    # Accept either a bare JSON array or {"clients": [...]}
+    data = request.json
+    clients = data.get("clients") if isinstance(data, dict) else data
+
+    if not isinstance(clients, list):
+        raise ApiError("Expected a list of clients")
+
+    max_clients = getattr(settings, "VERIFY_BULK_MAX_CLIENTS", 1000)
+    if len(clients) > max_clients:
+        raise ApiError(f"At most {max_clients} clients per request", status=413)
 
-            # Check if the lab exists under Collaborations
-            collaboration = Collaboration.objects.filter(
-                collab_email=email,
-                lab__lab_id=lab_id,
-                lab__verification_token=verification_token,
-                accepted=True
-            ).first()
+    triples = []
+    for client in clients:
+        try:
+            validate(client, LAB_ACCESS_SCHEMA)
+        except ApiError:
+            triples.append(None)
+            continue
+        triples.append((client["email"], client["lab_id"], client["verification_token"]))
 
-            if collaboration:
-                return JsonResponse({"success": True}, status=200)
+    verified = iter(lab_access_verified_bulk([triple for triple in triples if triple is not None]))
+    results = [
+        {"success": next(verified)} if triple is not None else {"success": False, "error": "Missing required fields"}
+        for triple in triples
+    ]
 
-            # If neither exists, return failure
-            return JsonResponse({"success": False, "error": "Lab not found or verification failed"}, status=404)
+    return {"success": True, "results": results}
 
-        except json.JSONDecodeError:
-            return JsonResponse({"success": False, "error": "Invalid JSON payload"}, status=400)
-        except Exception as e:
-            return JsonResponse({"success": False, "error": str(e)}, status=500)
+@csrf_exempt
+@api_view("POST", success_flag=True, schema=LAB_ACCESS_SCHEMA)
+async def verify_lab_from_socket_async(request):
+    data = request.json
+    if await alab_access_verified(data["email"], data["lab_id"], data["verification_token"]):
+        return {"success": True}
 
-    return JsonResponse({"success": False, "error": "Invalid request method"}, status=405)
+    # If neither exists, return failure
+    raise ApiError("Lab not found or verification failed", status=404)
 
 @csrf_exempt
 @api_login_required
+@api_view("POST", schema={"lab_id": Field(str, message="Lab ID is required")})
 def get_email_and_verification(request):
-    if request.method == "POST":
-        try:
-            # Parse request body
-            data = json.loads(request.body)
-            lab_id = data.get("lab_id")
-
-            # Retrieve user email
-            user_email = request.user.email
-
-            # Check if the lab exists in LabsActive
-            lab = LabsActive.objects.filter(
-                started_by__email=user_email,
-                lab_id=lab_id
-            ).first()
-
-            if lab:
-                return JsonResponse({
-                    "verification_token": lab.verification_token,
-                    "user_email": user_email,
-                    "lab_id": lab.lab_id, 
-                }, status=200)
-
-            # Check if the lab exists in Collaborations
-            collaboration = Collaboration.objects.filter(
-                collab_email=user_email,
-                accepted=True,
-                lab__lab_id=lab_id
-            ).first()
-
-            if collaboration:
-                return JsonResponse({
-                    "verification_token": collaboration.lab.verification_token,
-                    "user_email": user_email,
-                    "lab_id": collaboration.lab.lab_id, 
-                }, status=200)
-
-            # If neither exists, return an error
-            return JsonResponse({"error": "Lab not found or access denied"}, status=404)
-
-        except Exception as e:
-            print(e)
-            return JsonResponse({"error": str(e)}, status=500)
-
-    return JsonResponse({"error": "Invalid request method"}, status=405)
+    lab_id = request.json["lab_id"]
+
+    # Retrieve user email
+    user_email = request.user.email
+
+    # Check if the lab exists in LabsActive
+    lab = LabsActive.objects.filter(
+        started_by__email=user_email,
+        lab_id=lab_id
+    ).first()
+
+    if lab:
+        return {
+            "verification_token": lab.verification_token,
+            **lab_token_fields(lab, user_email, "owner"),
+            "user_email": user_email,
+            "lab_id": lab.lab_id,
+        }
+
+    # Check if the lab exists in Collaborations
+    collaboration = Collaboration.objects.filter(
+        collab_email=user_email,
+        accepted=True,
+        lab__lab_id=lab_id
+    ).first()
+
+    if collaboration:
+        return {
+            "verification_token": collaboration.lab.verification_token,
+            **lab_token_fields(collaboration.lab, user_email, collaboration.permission),
+            "user_email": user_email,
+            "lab_id": collaboration.lab.lab_id,
+        }
+
+    # If neither exists, return an error
+    raise ApiError("Lab not found or access denied", status=404)
@@ -0,0 +1,164 @@
+"""
+Shared request/response handling for the JSON API views.
+
+    @csrf_exempt
+    @api_login_required
+    @api_view("POST", schema={"lab_id": Field(str, message="Lab ID is required")}, success_flag=True)
+    def rejoin_lab(request):
+        lab = ...
+        if lab is None:
+            raise ApiError("No access or lab not found", status=404)
+        return {"message": "...", "success": True}
+
+api_view answers other methods with 405, parses a request body once into
+``request.json`` (400 on invalid JSON), checks it against ``schema`` (400),
+serializes the dict or list the view returns, and turns ApiError into its
+status and any other exception into a 500 with the exception text. Error
+bodies are ``{"error": message}``, plus ``"success": False`` for views that
+report success explicitly. JSON is encoded and decoded with orjson when it
+is installed and with the standard library otherwise. Login checks go
+outside api_view, so anonymous callers get 401 before their body is read.
+"""
+
+import json
+import logging
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.http.response import HttpResponseBase
+
+try:
+    import orjson
+except ImportError:  # Optional speedup
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+BODY_METHODS = frozenset(["POST", "PUT", "PATCH", "DELETE"])
+
+# Types neither codec handles natively (Decimal, timedelta, lazy strings, ...)
+_encoder = DjangoJSONEncoder()
+
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data, default=_encoder.default)
+    return json.dumps(data, cls=DjangoJSONEncoder, separators=(",", ":")).encode()
+
+
+def loads(body):
+    # Both codecs raise a ValueError subclass on malformed input
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+class ApiResponse(HttpResponse):
+    """An HttpResponse holding ``data`` serialized as JSON; any JSON value is allowed."""
+
+    def __init__(self, data, status=200, **kwargs):
+        kwargs.setdefault("content_type", "application/json")
+        super().__init__(dumps(data), status=status, **kwargs)
+
+
+class ApiError(Exception):
+    """Raised by a view to answer with ``{"error": message}`` and ``status``."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class Field:
+    """
+    One key of a request body schema: the accepted types, whether it must be
+    present and non-empty, an optional extra ``check`` on the value and the
+    error message to use instead of the generated one.
+    """
+
+    def __init__(self, *types, required=True, check=None, message=None):
+        self.types = types
+        self.required = required
+        self.check = check
+        self.message = message
+
+    def validate(self, name, value):
+        if value is None or value == "":
+            if self.required:
+                raise ApiError(self.message or f"{name} is required")
+            return
+        # bool is an int subclass; only accept it where bool is asked for
+        type_ok = isinstance(value, self.types) and (bool in self.types or not isinstance(value, bool))
+        if not type_ok or (self.check is not None and not self.check(value)):
+            expected = " or ".join(t.__name__ for t in self.types)
+            raise ApiError(self.message or f"{name} must be a valid {expected}")
+
+
+def validate(data, schema):
+    if not isinstance(data, dict):
+        raise ApiError("Expected a JSON object")
+    for name, field in schema.items():
+        field.validate(name, data.get(name))
+
+
+def api_view(*methods, schema=None, success_flag=False):
+    """Decorate a sync or async view; see the module docstring."""
+    allowed = frozenset(methods)
+
+    def error(message, status):
+        body = {"success": False, "error": message} if success_flag else {"error": message}
+        return ApiResponse(body, status=status)
+
+    def prepare(request):
+        # The error response for a request the view must not see, else None
+        if request.method not in allowed:
+            return error("Invalid request method", 405)
+        if request.method in BODY_METHODS:
+            try:
+                request.json = loads(request.body)
+            except ValueError:
+                return error("Invalid JSON", 400)
+            if schema is not None:
+                try:
+                    validate(request.json, schema)
+                except ApiError as e:
+                    return error(e.message, e.status)
+        return None
+
+    def finish(result):
+        return result if isinstance(result, HttpResponseBase) else ApiResponse(result)
+
+    def failure(request, e):
+        if isinstance(e, ApiError):
+            return error(e.message, e.status)
+        logger.exception("Unhandled error in %s", request.path)
+        return error(str(e), 500)
+
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_wrapped_view(request, *args, **kwargs):
+                response = prepare(request)
+                if response is not None:
+                    return response
+                try:
+                    return finish(await view_func(request, *args, **kwargs))
+                except Exception as e:
+                    return failure(request, e)
+            return async_wrapped_view
+
+        @wraps(view_func)
+        def wrapped_view(request, *args, **kwargs):
+            response = prepare(request)
+            if response is not None:
+                return response
+            try:
+                return finish(view_func(request, *args, **kwargs))
+            except Exception as e:
+                return failure(request, e)
+        return wrapped_view
+
+    return decorator
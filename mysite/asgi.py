@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mysite.settings")
+# Route the hot endpoints to their native async views (see ASYNC_VIEWS)
+os.environ.setdefault("DJANGO_ASYNC_VIEWS", "1")
 
 application = get_asgi_application()
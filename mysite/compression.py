@@ -0,0 +1,48 @@
+"""
+Response compression: brotli when the brotli package is installed and the
+client accepts it, gzip otherwise (Django's GZipMiddleware). Bodies under
+COMPRESS_MIN_BYTES are sent as they are, since compressing them costs more
+time than the bytes saved, and event streams are never compressed so that
+each event reaches the client as soon as it is written.
+"""
+
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+
+try:
+    import brotli
+except ImportError:  # Optional; gzip is used without it
+    brotli = None
+
+re_accepts_brotli = _lazy_re_compile(r"\bbr\b")
+
+
+class CompressionMiddleware(GZipMiddleware):
+    def process_response(self, request, response):
+        if response.get("Content-Type", "").startswith("text/event-stream"):
+            return response
+        if not response.streaming and len(response.content) < getattr(settings, "COMPRESS_MIN_BYTES", 1024):
+            return response
+        if (
+            brotli is None
+            or response.streaming
+            or response.has_header("Content-Encoding")
+            or not re_accepts_brotli.search(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        ):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        compressed_content = brotli.compress(response.content, quality=getattr(settings, "BROTLI_QUALITY", 5))
+        if len(compressed_content) >= len(response.content):
+            return response
+        response.content = compressed_content
+        response.headers["Content-Length"] = str(len(response.content))
+        # As GZipMiddleware does: the encoded bytes differ, so a strong ETag
+        # becomes weak, which If-None-Match still matches
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = "br"
+        return response
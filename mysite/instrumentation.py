@@ -0,0 +1,201 @@
+"""
+Per-request instrumentation.
+
+RequestMetricsMiddleware times every request and, through a database
+execute wrapper, counts its queries and their total duration. Code that
+wants its own timing reported (chat inference, for example) wraps it in
+``timing("inference")``. Each finished request is folded into per-view
+histograms held in ``request_metrics``; a sample of requests can also be
+written to the "mysite.requests" logger as one JSON object per line.
+"""
+
+import bisect
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from .metrics import flush_if_due
+
+logger = logging.getLogger("mysite.requests")
+
+# Upper bounds in seconds, from 1 ms to 10 s; anything slower lands in +Inf
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """Per-bucket (non-cumulative) counts plus count and sum of observed values."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def to_dict(self):
+        bounds = [str(bound) for bound in self.buckets] + ["+Inf"]
+        return {"count": self.count, "sum": self.sum, "buckets": dict(zip(bounds, self.counts))}
+
+
+class RequestStats:
+    """What one request spent its time on; filled in while it runs."""
+
+    __slots__ = ("queries", "db_seconds", "timings")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.timings = {}
+
+
+class RequestMetrics:
+    """Histograms per view of wall time, DB queries, DB time and named timings."""
+
+    def __init__(self):
+        self._views = {}
+        self._lock = threading.Lock()
+
+    def record(self, view, status, wall_seconds, stats):
+        with self._lock:
+            metrics = self._views.get(view)
+            if metrics is None:
+                metrics = self._views[view] = {
+                    "statuses": {},
+                    "wall_seconds": Histogram(LATENCY_BUCKETS),
+                    "db_queries": Histogram(QUERY_COUNT_BUCKETS),
+                    "db_seconds": Histogram(LATENCY_BUCKETS),
+                    "timings": {},
+                }
+            metrics["statuses"][status] = metrics["statuses"].get(status, 0) + 1
+            metrics["wall_seconds"].observe(wall_seconds)
+            metrics["db_queries"].observe(stats.queries)
+            metrics["db_seconds"].observe(stats.db_seconds)
+            for name, seconds in stats.timings.items():
+                if name not in metrics["timings"]:
+                    metrics["timings"][name] = Histogram(LATENCY_BUCKETS)
+                metrics["timings"][name].observe(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                view: {
+                    "statuses": dict(metrics["statuses"]),
+                    "wall_seconds": metrics["wall_seconds"].to_dict(),
+                    "db_queries": metrics["db_queries"].to_dict(),
+                    "db_seconds": metrics["db_seconds"].to_dict(),
+                    "timings": {name: histogram.to_dict() for name, histogram in metrics["timings"].items()},
+                }
+                for view, metrics in self._views.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+request_metrics = RequestMetrics()
+
+# The stats of the request being handled. Context variables follow a request
+# into sync_to_async threads, so async views' queries are counted too.
+_current = ContextVar("request_stats", default=None)
+
+
+@contextmanager
+def timing(name):
+    """Add the time spent in the block to the current request's ``name`` timing."""
+    stats = _current.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if stats is not None:
+            stats.timings[name] = stats.timings.get(name, 0.0) + time.perf_counter() - started
+
+
+def _count_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_seconds += time.perf_counter() - started
+
+
+def _install_query_counter(sender, connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+connection_created.connect(_install_query_counter)
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, "REQUEST_LOG_SAMPLE_RATE", 0.0)
+        # Connections opened before this module was imported missed the signal
+        for connection in connections.all(initialized_only=True):
+            _install_query_counter(None, connection)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, time.perf_counter() - started, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, time.perf_counter() - started, stats)
+        return response
+
+    def finish(self, request, response, wall_seconds, stats):
+        match = request.resolver_match
+        view = match.view_name if match is not None else "<unresolved>"
+        request_metrics.record(view, response.status_code, wall_seconds, stats)
+        flush_if_due()
+
+        if self.sample_rate and random.random() < self.sample_rate:
+            logger.info(json.dumps({
+                "view": view,
+                "method": request.method,
+                "status": response.status_code,
+                "wall_ms": round(wall_seconds * 1000, 3),
+                "db_queries": stats.queries,
+                "db_ms": round(stats.db_seconds * 1000, 3),
+                **{f"{name}_ms": round(seconds * 1000, 3) for name, seconds in stats.timings.items()},
+            }))
@@ -0,0 +1,240 @@
+"""
+Prometheus text-format metrics for /metrics/.
+
+Every process collects its own request histograms (see instrumentation),
+chat batching, inference and cache counters and the lab verification cache
+counters. Under gunicorn each worker only sees its own numbers, so when
+METRICS_DIR is set every process also writes its samples to
+``METRICS_DIR/<pid>.json`` (at most once per METRICS_FLUSH_INTERVAL_SECONDS)
+and the endpoint adds up the files of all processes. Counters and histograms
+are summed over every file; gauges only over processes that are still alive.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_flush_lock = threading.Lock()
+_last_flush = 0.0
+
+
+def _histogram(name, labels, histogram):
+    """Samples of one histogram dict from RequestMetrics, with cumulative buckets."""
+    cumulative = 0
+    for bound, count in histogram["buckets"].items():
+        cumulative += count
+        yield [f"{name}_bucket", {**labels, "le": bound}, cumulative]
+    yield [f"{name}_sum", labels, histogram["sum"]]
+    yield [f"{name}_count", labels, histogram["count"]]
+
+
+def _family(name, kind, help_text, samples):
+    return {"name": name, "type": kind, "help": help_text, "samples": list(samples)}
+
+
+def _request_families(snapshot):
+    def histograms(name, key):
+        for view, metrics in snapshot.items():
+            yield from _histogram(name, {"view": view}, metrics[key])
+
+    families = [_family("django_http_requests_total", "counter", "Requests by view and status.", (
+        ["django_http_requests_total", {"view": view, "status": str(status)}, count]
+        for view, metrics in snapshot.items()
+        for status, count in metrics["statuses"].items()
+    ))]
+    for key, name, help_text in (
+        ("wall_seconds", "django_http_request_duration_seconds", "Wall time per request."),
+        ("db_queries", "django_http_request_db_queries", "Database queries per request."),
+        ("db_seconds", "django_http_request_db_duration_seconds", "Database time per request."),
+    ):
+        families.append(_family(name, "histogram", help_text, histograms(name, key)))
+    families.append(_family(
+        "django_http_request_timing_seconds", "histogram", "Named timings per request, e.g. chat inference.", (
+            sample
+            for view, metrics in snapshot.items()
+            for timing, histogram in metrics["timings"].items()
+            for sample in _histogram("django_http_request_timing_seconds", {"view": view, "timing": timing}, histogram)
+        ),
+    ))
+    return families
+
+
+def _batching_families(stats):
+    # The batcher keeps power-of-two batch sizes; emit every bound so that
+    # processes which never saw a given size still add up correctly
+    bounds, bound = [], 1
+    while bound < stats["max_batch_size"]:
+        bounds.append(bound)
+        bound *= 2
+    bounds.append(bound)
+    histogram = {
+        "buckets": {**{str(b): stats["batch_size_histogram"].get(str(b), 0) for b in bounds}, "+Inf": 0},
+        "sum": stats["items"],
+        "count": stats["batches"],
+    }
+    return [
+        _family("chat_batch_size", "histogram", "Messages per model call made by the micro-batcher.",
+                _histogram("chat_batch_size", {}, histogram)),
+        _family("chat_batch_queue_wait_seconds_total", "counter", "Time messages spent queued for a batch.",
+                [["chat_batch_queue_wait_seconds_total", {}, stats["queue_wait_seconds_total"]]]),
+        _family("chat_batch_predict_seconds_total", "counter", "Time spent in batched model calls.",
+                [["chat_batch_predict_seconds_total", {}, stats["predict_seconds_total"]]]),
+        _family("chat_batch_queue_depth", "gauge", "Messages waiting for the micro-batcher.",
+                [["chat_batch_queue_depth", {}, stats["queued"]]]),
+    ]
+
+
+def _cache_families(prefix, description, stats, counters):
+    families = [
+        _family(f"{prefix}_{counter}_total", "counter", f"{description} {counter}.",
+                [[f"{prefix}_{counter}_total", {}, stats[counter]]])
+        for counter in counters
+    ]
+    families.append(_family(f"{prefix}_entries", "gauge", f"{description} size.",
+                            [[f"{prefix}_entries", {}, stats["size"]]]))
+    return families
+
+
+def _invite_event_families(stats):
+    return [
+        _family("invite_event_streams", "gauge", "Open invite_events streams.",
+                [["invite_event_streams", {}, stats["subscribers"]]]),
+        _family("invite_events_published_total", "counter", "Invite events published to the hub.",
+                [["invite_events_published_total", {}, stats["published"]]]),
+        _family("invite_events_dropped_total", "counter", "Invite events dropped for streams that fell behind.",
+                [["invite_events_dropped_total", {}, stats["dropped"]]]),
+    ]
+
+
+def collect():
+    """This process's metric families as JSON-serializable dicts."""
+    # Imported here: the app modules load models and settings-derived objects
+    from chat_assistant.views import backend, batcher, prediction_cache
+    from custom_auth.cache import verification_cache
+    from custom_auth.events import invite_hub
+    from .instrumentation import request_metrics
+
+    backend_stats = backend.stats()
+    return [
+        *_request_families(request_metrics.snapshot()),
+        _family("chat_inference_submitted_total", "counter", "Prediction calls sent to the inference backend.",
+                [["chat_inference_submitted_total", {"backend": backend_stats["backend"]}, backend_stats["submitted"]]]),
+        *_batching_families(batcher.stats()),
+        *_cache_families("chat_prediction_cache", "Chat prediction cache", prediction_cache.stats(),
+                         ("hits", "misses", "evictions", "expirations", "invalidations")),
+        *_cache_families("lab_verification_cache", "Lab verification cache", verification_cache.stats(),
+                         ("hits", "misses", "invalidations")),
+        *_invite_event_families(invite_hub.stats()),
+    ]
+
+
+def _metrics_dir():
+    return getattr(settings, "METRICS_DIR", None)
+
+
+def flush(directory=None):
+    """Write this process's samples to ``<directory>/<pid>.json``, atomically."""
+    directory = directory or _metrics_dir()
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(collect(), f)
+    os.replace(path, os.path.join(directory, f"{os.getpid()}.json"))
+
+
+def flush_if_due():
+    """Called after each request; flushes when the interval has passed."""
+    global _last_flush
+    if not _metrics_dir():
+        return
+    now = time.monotonic()
+    if now - _last_flush < getattr(settings, "METRICS_FLUSH_INTERVAL_SECONDS", 1.0):
+        return
+    if not _flush_lock.acquire(blocking=False):
+        return
+    try:
+        _last_flush = now
+        flush()
+    finally:
+        _flush_lock.release()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def merge(processes):
+    """
+    Add up ``[(pid, families), ...]`` sample by sample. Gauges of processes
+    that have exited are dropped; their counters are kept.
+    """
+    merged = {}
+    for pid, families in processes:
+        alive = _pid_alive(pid)
+        for family in families:
+            target = merged.setdefault(family["name"], {**family, "samples": {}})
+            if family["type"] == "gauge" and not alive:
+                continue
+            for name, labels, value in family["samples"]:
+                key = (name, tuple(labels.items()))
+                target["samples"][key] = target["samples"].get(key, 0) + value
+    return [
+        {**family, "samples": [[name, dict(labels), value] for (name, labels), value in family["samples"].items()]}
+        for family in merged.values()
+    ]
+
+
+def read_all(directory):
+    processes = []
+    for filename in os.listdir(directory):
+        if not filename.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(directory, filename)) as f:
+                processes.append((int(filename[:-5]), json.load(f)))
+        except (OSError, ValueError):
+            # Another process is replacing its file or left a broken one
+            continue
+    return processes
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render(families):
+    lines = []
+    for family in families:
+        lines.append(f"# HELP {family['name']} {family['help']}")
+        lines.append(f"# TYPE {family['name']} {family['type']}")
+        for name, labels, value in family["samples"]:
+            label_text = ",".join(f'{key}="{_escape(label)}"' for key, label in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def metrics(request):
+    if request.method == "GET":
+        directory = _metrics_dir()
+        if directory:
+            flush(directory)
+            families = merge(read_all(directory))
+        else:
+            families = collect()
+        return HttpResponse(render(families), content_type=CONTENT_TYPE)
+    return JsonResponse({"error": "Invalid request method"}, status=405)
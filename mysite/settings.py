@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,6 +43,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover every other middleware
+    "mysite.instrumentation.RequestMetricsMiddleware",
+    # Before everything that reads or changes the response body
+    "mysite.compression.CompressionMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -98,20 +103,95 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "mysite.wsgi.application"
 
+# Serve the hot endpoints (predict_intentions, verify_lab_from_socket,
+# get_all_labs, get_active_labs, rejoin_lab) with native async views.
+# mysite/asgi.py turns this on; under WSGI the sync views avoid a per-request
+# event loop.
+ASYNC_VIEWS = os.environ.get("DJANGO_ASYNC_VIEWS") == "1"
+
 
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# DJANGO_DB_ENGINE picks the profile: "sqlite" (default) or "postgres".
+#
+# SQLite runs in WAL mode so readers no longer block on a writer, with
+# synchronous=NORMAL (safe under WAL, fsyncs at checkpoints only), a memory
+# mapped read path and a busy timeout instead of immediate "database is
+# locked" errors. Write transactions start IMMEDIATE so two start_lab or
+# accept_collab calls queue on the write lock rather than deadlocking when
+# both try to upgrade a read lock.
+SQLITE_BUSY_TIMEOUT_SECONDS = 5
+SQLITE_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA mmap_size=134217728",  # 128 MiB
+    "PRAGMA cache_size=-16000",  # 16 MB page cache per connection
+    "PRAGMA temp_store=MEMORY",
+]
+
+# Postgres keeps connections open for DJANGO_DB_CONN_MAX_AGE seconds and
+# checks them before reuse, so a restarted database does not fail requests.
+if os.environ.get("DJANGO_DB_ENGINE", "sqlite") == "postgres":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get("DJANGO_DB_NAME", "fygenson"),
+            "USER": os.environ.get("DJANGO_DB_USER", ""),
+            "PASSWORD": os.environ.get("DJANGO_DB_PASSWORD", ""),
+            "HOST": os.environ.get("DJANGO_DB_HOST", ""),
+            "PORT": os.environ.get("DJANGO_DB_PORT", ""),
+            "CONN_MAX_AGE": int(os.environ.get("DJANGO_DB_CONN_MAX_AGE", "60")),
+            "CONN_HEALTH_CHECKS": True,
+        }
+    }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "db.sqlite3",
+            "OPTIONS": {
+                "init_command": ";".join(SQLITE_PRAGMAS),
+                "transaction_mode": "IMMEDIATE",
+                "timeout": SQLITE_BUSY_TIMEOUT_SECONDS,
+            },
+        }
+    }
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+#
+# Per-process local memory by default. Set DJANGO_REDIS_URL (needs the redis
+# package) to share one cache between workers, which also makes the write-side
+# invalidation of cached users, sessions and the lab catalog global.
+if os.environ.get("DJANGO_REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["DJANGO_REDIS_URL"],
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "mysite",
+            "OPTIONS": {"MAX_ENTRIES": 10000},
+        }
     }
-}
+
+# Sessions are read from the cache and written through to the database, so
+# they survive a cache flush or restart.
+SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
 
 AUTH_USER_MODEL = "custom_auth.CustomUser"
 REST_AUTH_USER_MODEL = AUTH_USER_MODEL
 
+# CachedModelBackend serves the per-request user lookup from the cache. It is
+# the only backend, so a failed login hashes the password once; migration
+# custom_auth 0006 moves sessions created under ModelBackend over to it.
+AUTHENTICATION_BACKENDS = ["custom_auth.backends.CachedModelBackend"]
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -146,3 +226,113 @@ STATIC_URL = "static/"
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+# Chat assistant inference
+# fastText models load on first use. Set CHAT_WARMUP_MODELS=1 to load them in
+# AppConfig.ready instead; with gunicorn --preload the forked workers then
+# share the master's copy of the model memory.
+
+CHAT_WARMUP_MODELS = os.environ.get("CHAT_WARMUP_MODELS") == "1"
+
+# Where fastText inference runs: "inline" (in the request thread), "thread"
+# (a thread pool sharing this process's models) or "process" (the inference
+# server started with `manage.py run_inference_server`). The server runs
+# CHAT_INFERENCE_WORKERS processes that each load the models once and are
+# shared by every HTTP worker, which holds no copy; HTTP workers reach it at
+# CHAT_INFERENCE_SERVER, authenticated with SECRET_KEY. With "thread" the
+# workers are threads of each HTTP worker.
+CHAT_INFERENCE_BACKEND = os.environ.get("CHAT_INFERENCE_BACKEND", "inline")
+CHAT_INFERENCE_WORKERS = int(os.environ.get("CHAT_INFERENCE_WORKERS", "1"))
+CHAT_INFERENCE_SERVER = os.environ.get("CHAT_INFERENCE_SERVER", "127.0.0.1:8765")
+
+# Concurrent predict_intentions calls are collected into one fastText call per
+# model. A batch is flushed when it is full or when the window has elapsed.
+CHAT_BATCHING_ENABLED = True
+CHAT_BATCH_MAX_SIZE = 64
+CHAT_BATCH_MAX_WAIT_MS = 5
+# A batched prediction taking longer than this fails the request with 503
+CHAT_INFERENCE_TIMEOUT_SECONDS = 30
+
+# Each model is asked once for its CHAT_MAX_TOP_K best labels; requests may
+# pass "k" (up to this limit) and a probability "threshold" to narrow them.
+CHAT_MAX_TOP_K = 5
+
+# Maximum number of messages accepted by chat/predict_intentions_batch/.
+# Larger requests are rejected with 413 and should be split by the client.
+CHAT_BULK_MAX_MESSAGES = 256
+
+# In-process prediction cache keyed on case-folded, whitespace-collapsed text.
+# Eviction policy is "lru" or "fifo"; a TTL of None keeps entries until evicted.
+# When a model file under ./models/ changes the cache is cleared and the
+# models are reloaded (the inference server replaces its processes).
+CHAT_CACHE_ENABLED = True
+CHAT_CACHE_MAX_SIZE = 10000
+CHAT_CACHE_TTL_SECONDS = 3600
+CHAT_CACHE_EVICTION_POLICY = "lru"
+
+# verify_lab_from_socket outcomes are cached per (email, lab_id, token) for a
+# few seconds; saving or deleting a lab or collaboration drops its entries.
+VERIFICATION_CACHE_TTL_SECONDS = 5
+VERIFICATION_CACHE_MAX_SIZE = 10000
+
+# Maximum number of {email, lab_id, verification_token} entries accepted by
+# auth/verify_labs_from_socket/ in one request.
+VERIFY_BULK_MAX_CLIENTS = 1000
+
+# Opt-in stateless lab tokens: start_lab, rejoin_lab and
+# get_email_and_verification also return a "lab_token" signed with SECRET_KEY
+# that encodes lab, email, permission and expiry. verify_lab_from_socket checks
+# such tokens without a database query. Tokens live until the lab's max_time
+# runs out, capped at LAB_TOKEN_MAX_AGE_SECONDS.
+SIGNED_LAB_TOKENS = False
+LAB_TOKEN_MAX_AGE_SECONDS = 12 * 60 * 60
+
+# get_all_labs serves the LabStation catalog and the active lab owners from
+# the cache. Both are invalidated on write in the writing process; the TTLs
+# bound how stale another worker's copy can be.
+LAB_CATALOG_CACHE_TTL_SECONDS = 300
+ACTIVE_LABS_CACHE_TTL_SECONDS = 5
+
+# auth/get_all_emails/ returns one page of the user directory per request,
+# filtered by the ?q= email prefix. ?limit= may ask for up to the maximum.
+USER_DIRECTORY_PAGE_SIZE = 20
+USER_DIRECTORY_MAX_PAGE_SIZE = 100
+
+# RequestMetricsMiddleware keeps per-view histograms of wall time, DB query
+# count, DB time and chat inference time. This fraction of requests is also
+# logged as JSON to the "mysite.requests" logger (0 disables the log).
+REQUEST_LOG_SAMPLE_RATE = float(os.environ.get("DJANGO_REQUEST_LOG_SAMPLE_RATE", "0"))
+
+# /metrics/ serves the above plus chat batching/cache and lab verification
+# cache counters in Prometheus text format. With several worker processes
+# (gunicorn), point METRICS_DIR at a directory shared by the workers and
+# empty it on deploy; each worker writes its samples there at most every
+# METRICS_FLUSH_INTERVAL_SECONDS and the endpoint adds them up.
+METRICS_DIR = os.environ.get("DJANGO_METRICS_DIR") or None
+METRICS_FLUSH_INTERVAL_SECONDS = 1.0
+
+# Users looked up by AuthenticationMiddleware are cached this long; saving or
+# deleting a user drops its entry. Through Redis that is seen by every worker;
+# with the per-process cache other workers keep a deactivated user or an old
+# password hash until the TTL runs out, so it is kept short there.
+USER_CACHE_TTL_SECONDS = 300 if os.environ.get("DJANGO_REDIS_URL") else 5
+
+# auth/invite_events/ (ASGI only) streams invite notifications as server-sent
+# events. Idle streams get a keepalive comment this often; each stream buffers
+# at most INVITE_EVENTS_QUEUE_SIZE undelivered events before dropping them.
+# Events reach streams open on the worker process that made the change.
+INVITE_EVENTS_KEEPALIVE_SECONDS = 15
+INVITE_EVENTS_QUEUE_SIZE = 100
+
+# get_active_labs and get_all_emails answer conditional GETs (If-None-Match)
+# from version stamps kept in the cache and bumped when a write commits. The
+# stamps are shared through Redis; with the per-process cache a write only
+# bumps the writing worker's stamps, so the TTL bounds how long another worker
+# can keep answering 304 for a listing that changed.
+LISTING_VERSION_TTL_SECONDS = 24 * 60 * 60 if os.environ.get("DJANGO_REDIS_URL") else 5
+
+# Responses of at least COMPRESS_MIN_BYTES are brotli-compressed when the
+# brotli package is installed and the client accepts it, else gzipped.
+# Quality 5 of 11 keeps brotli about as fast as gzip for dynamic responses.
+COMPRESS_MIN_BYTES = 1024
+BROTLI_QUALITY = 5
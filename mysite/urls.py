@@ -16,8 +16,11 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from .metrics import metrics
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('chat/', include('chat_assistant.urls')),  # Replace 'myapp' with your app name
     path("auth/", include("custom_auth.urls")),
+    path("metrics/", metrics, name="metrics"),  # Prometheus scrape endpoint
 ]